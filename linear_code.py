@@ -5,8 +5,2896 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.patches as patches
 from matplotlib.figure import Figure
+import asyncio
+import bisect
 import cmath
-from collections import defaultdict
+import csv
+import hashlib
+import json
+import os
+import socket
+import struct
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import chain, islice, repeat
+from multiprocessing import shared_memory
+
+try:
+    import scipy.linalg as sla
+    import scipy.sparse as sp
+    import scipy.sparse.linalg as spla
+except ImportError:  # SciPy is optional, plain NumPy solves are used instead
+    sla = sp = spla = None
+
+
+# ---------------------------------------------------------------------------
+# Device registry
+#
+# Every element type supplies vectorized kernels that work on all instances of
+# that type at once. Kernels receive:
+#   nodes    - int array (n, terminals) of MNA row indices, ground mapped to
+#              the extra "ground" slot (== matrix size, dropped after assembly)
+#   values   - float array (..., n, params) of element parameters
+#   branches - int array (n, branches) of extra MNA rows owned by each instance
+#   omega    - angular frequency, scalar or array shaped (..., 1)
+# ---------------------------------------------------------------------------
+
+def _triplets(entries, shape):
+    """Concatenate (rows, cols, vals) stamp entries into COO triplets
+
+    Each vals is broadcast to shape[:-1] + (len(its rows),), so entries
+    may differ in length.
+    """
+    rows = np.concatenate([r for r, _, _ in entries])
+    cols = np.concatenate([c for _, c, _ in entries])
+    # Fill one preallocated block per entry rather than broadcasting each
+    vals = np.empty(shape[:-1] + (rows.size,), dtype=np.result_type(*(v for _, _, v in entries)))
+    offset = 0
+    for r, _, v in entries:
+        vals[..., offset:offset + r.size] = v
+        offset += r.size
+    return rows, cols, vals
+
+
+def _stamp_shape(values, omega):
+    if np.ndim(omega) == 0:  # the common single-frequency case, without broadcast_shapes overhead
+        return values.shape[:-1]
+    return np.broadcast_shapes(values.shape[:-1], np.shape(omega))
+
+
+class DeviceType:
+    """Base class for the vectorized stamp/current kernels of one element type"""
+    name = None
+    terminals = 2   # number of node connections
+    branches = 0    # extra MNA rows per instance (branch currents)
+    params = 1      # number of values per instance
+    ports = ((0, 1),)  # terminal pairs whose current the device reports
+    links = ((0, 1),)  # terminal pairs joined by an impedance or a voltage constraint
+    passive = False  # two-terminal impedance usable in series/parallel checks
+    unit = ""
+    scale = 1.0     # base units -> display units
+    symbol = "dependent_source"
+    gui = True      # offered in the component type menu
+    pencil_branches = 0  # extra rows per instance in the G + sC form
+
+    def stamp(self, nodes, values, branches, omega):
+        """Return (rows, cols, vals) triplets for all instances
+
+        Each returned array is made of n-long blocks in instance order, so
+        triplet t belongs to instance t % n.
+        """
+        raise NotImplementedError
+
+    def stamp_derivative(self, nodes, values, branches, omega, param):
+        """d(vals)/d(values[..., param]) by central differences"""
+        p = values[..., param]
+        step = 1e-6 * np.where(p != 0, np.abs(p), 1.0)
+        plus = values.copy()
+        minus = values.copy()
+        plus[..., param] += step
+        minus[..., param] -= step
+        rows, cols, v_plus = self.stamp(nodes, plus, branches, omega)
+        _, _, v_minus = self.stamp(nodes, minus, branches, omega)
+        owner = np.arange(rows.size) % len(nodes)
+        return rows, cols, (v_plus - v_minus) / (2 * step[..., owner])
+
+    def pencil(self, nodes, values, branches, extra):
+        """Return (rows, cols, g, c) with the stamp written as G + sC
+
+        The default reads G and C off the stamp at omega = 0 and 1, which
+        is exact for stamps affine in jω. Devices that are not (1/jωL)
+        override this and use their pencil_branches rows in extra.
+        """
+        rows, cols, g = self.stamp(nodes, values, branches, 0.0)
+        _, _, v = self.stamp(nodes, values, branches, 1.0)
+        return rows, cols, g.real, ((v - g) / 1j).real
+
+    def currents(self, x, nodes, values, branches, omega):
+        """Return port currents shaped (..., n, ports) from the solution x"""
+        raise NotImplementedError
+
+    def format_value(self, value):
+        return f"{value * self.scale:.2f}{self.unit}"
+
+
+class PassiveDevice(DeviceType):
+    """Two-terminal element described entirely by its admittance"""
+    passive = True
+
+    def admittance(self, values, omega):
+        raise NotImplementedError
+
+    def dadmittance(self, values, omega):
+        raise NotImplementedError
+
+    def impedance(self, value, omega):
+        return 1 / self.admittance(np.array([[value]], dtype=float), omega)[0]
+
+    def stamp(self, nodes, values, branches, omega):
+        shape = _stamp_shape(values, omega)
+        y = self.admittance(values, omega)
+        i, j = nodes[:, 0], nodes[:, 1]
+        return _triplets([(i, i, y), (j, j, y), (i, j, -y), (j, i, -y)], shape)
+
+    def stamp_derivative(self, nodes, values, branches, omega, param):
+        shape = _stamp_shape(values, omega)
+        dy = self.dadmittance(values, omega)
+        i, j = nodes[:, 0], nodes[:, 1]
+        return _triplets([(i, i, dy), (j, j, dy), (i, j, -dy), (j, i, -dy)], shape)
+
+    def currents(self, x, nodes, values, branches, omega):
+        y = self.admittance(values, omega)
+        return (y * (x[..., nodes[:, 0]] - x[..., nodes[:, 1]]))[..., None]
+
+
+class Resistor(PassiveDevice):
+    name = "Resistor"
+    unit = "Ω"
+    symbol = "resistor"
+
+    def admittance(self, values, omega):
+        return 1 / values[..., 0]
+
+    def dadmittance(self, values, omega):
+        return -1 / values[..., 0] ** 2
+
+
+class Capacitor(PassiveDevice):
+    name = "Capacitor"
+    unit = "μF"
+    scale = 1e6  # F to μF
+    symbol = "capacitor"
+
+    def admittance(self, values, omega):
+        return 1j * omega * values[..., 0]
+
+    def dadmittance(self, values, omega):
+        return 1j * omega * np.ones_like(values[..., 0])
+
+
+class Inductor(PassiveDevice):
+    name = "Inductor"
+    unit = "mH"
+    scale = 1e3  # H to mH
+    symbol = "inductor"
+
+    pencil_branches = 1
+
+    def admittance(self, values, omega):
+        return 1 / (1j * omega * values[..., 0])
+
+    def dadmittance(self, values, omega):
+        return -1 / (1j * omega * values[..., 0] ** 2)
+
+    def pencil(self, nodes, values, branches, extra):
+        # Branch current m with V(i) - V(j) - sL I = 0
+        i, j = nodes[:, 0], nodes[:, 1]
+        m = extra[:, 0]
+        entries = [(i, m, 1.0), (j, m, -1.0), (m, i, 1.0), (m, j, -1.0), (m, m, 0.0)]
+        rows, cols, g = _triplets(entries, (len(nodes),))
+        c = np.concatenate((np.zeros(4 * len(nodes)), -values[:, 0]))
+        return rows, cols, g, c
+
+
+class VCVS(DeviceType):
+    """Voltage-controlled voltage source: V(o+,o-) = gain * V(c+,c-)"""
+    name = "VCVS"
+    terminals = 4
+    branches = 1
+    unit = "V/V"
+
+    def stamp(self, nodes, values, branches, omega):
+        shape = _stamp_shape(values, omega)
+        op, om, cp, cm = nodes.T
+        m = branches[:, 0]
+        gain = values[..., 0]
+        return _triplets([(op, m, 1), (om, m, -1), (m, op, 1), (m, om, -1),
+                          (m, cp, -gain), (m, cm, gain)], shape)
+
+    def currents(self, x, nodes, values, branches, omega):
+        return x[..., branches[:, :1]]
+
+
+class VCCS(DeviceType):
+    """Voltage-controlled current source: I(o+ -> o-) = gain * V(c+,c-)"""
+    name = "VCCS"
+    terminals = 4
+    links = ()
+    unit = "S"
+
+    def stamp(self, nodes, values, branches, omega):
+        shape = _stamp_shape(values, omega)
+        op, om, cp, cm = nodes.T
+        g = values[..., 0]
+        return _triplets([(op, cp, g), (op, cm, -g), (om, cp, -g), (om, cm, g)], shape)
+
+    def currents(self, x, nodes, values, branches, omega):
+        g = values[..., 0]
+        return (g * (x[..., nodes[:, 2]] - x[..., nodes[:, 3]]))[..., None]
+
+
+def _sense_entries(nodes, m):
+    """0 V ammeter between c+ and c- whose current is the branch unknown m"""
+    cp, cm = nodes[:, 2], nodes[:, 3]
+    return [(cp, m, 1), (cm, m, -1), (m, cp, 1), (m, cm, -1)]
+
+
+class CCCS(DeviceType):
+    """Current-controlled current source: I(o+ -> o-) = gain * I(c+ -> c-)"""
+    name = "CCCS"
+    terminals = 4
+    branches = 1
+    ports = ((0, 1), (2, 3))
+    links = ((2, 3),)
+    unit = "A/A"
+
+    def stamp(self, nodes, values, branches, omega):
+        shape = _stamp_shape(values, omega)
+        op, om = nodes[:, 0], nodes[:, 1]
+        m = branches[:, 0]
+        gain = values[..., 0]
+        return _triplets(_sense_entries(nodes, m) + [(op, m, gain), (om, m, -gain)], shape)
+
+    def currents(self, x, nodes, values, branches, omega):
+        sense = x[..., branches[:, 0]]
+        return np.stack((values[..., 0] * sense, sense), axis=-1)
+
+
+class CCVS(DeviceType):
+    """Current-controlled voltage source: V(o+,o-) = gain * I(c+ -> c-)"""
+    name = "CCVS"
+    terminals = 4
+    branches = 2
+    ports = ((0, 1), (2, 3))
+    links = ((0, 1), (2, 3))
+    unit = "Ω"
+
+    def stamp(self, nodes, values, branches, omega):
+        shape = _stamp_shape(values, omega)
+        op, om = nodes[:, 0], nodes[:, 1]
+        ms, mo = branches[:, 0], branches[:, 1]
+        gain = values[..., 0]
+        return _triplets(_sense_entries(nodes, ms) + [
+            (op, mo, 1), (om, mo, -1), (mo, op, 1), (mo, om, -1), (mo, ms, -gain)], shape)
+
+    def currents(self, x, nodes, values, branches, omega):
+        return x[..., branches[:, ::-1]]
+
+
+class CoupledInductors(DeviceType):
+    """Two magnetically coupled windings, value = (L1, L2, k)"""
+    name = "Coupled Inductors"
+    terminals = 4
+    branches = 2
+    params = 3
+    ports = ((0, 1), (2, 3))
+    links = ((0, 1), (2, 3))
+    symbol = "inductor"
+    gui = False
+
+    def stamp(self, nodes, values, branches, omega):
+        shape = _stamp_shape(values, omega)
+        ap, am, bp, bm = nodes.T
+        m1, m2 = branches[:, 0], branches[:, 1]
+        l1, l2, k = values[..., 0], values[..., 1], values[..., 2]
+        z1 = 1j * omega * l1
+        z2 = 1j * omega * l2
+        zm = 1j * omega * k * np.sqrt(l1 * l2)
+        return _triplets([
+            (ap, m1, 1), (am, m1, -1), (m1, ap, 1), (m1, am, -1),
+            (bp, m2, 1), (bm, m2, -1), (m2, bp, 1), (m2, bm, -1),
+            (m1, m1, -z1), (m1, m2, -zm), (m2, m2, -z2), (m2, m1, -zm)], shape)
+
+    def currents(self, x, nodes, values, branches, omega):
+        return x[..., branches]
+
+    def format_value(self, value):
+        l1, l2, k = value
+        return f"{l1 * 1e3:.2f}mH/{l2 * 1e3:.2f}mH k={k:.2f}"
+
+
+DEVICE_TYPES = {}
+
+
+def register_device_type(device):
+    """Make a DeviceType instance available to the solver and the GUI"""
+    DEVICE_TYPES[device.name] = device
+    return device
+
+
+def get_device_type(name):
+    try:
+        return DEVICE_TYPES[name]
+    except KeyError:
+        raise ValueError(f"Unknown component type '{name}'") from None
+
+
+for _device in (Resistor(), Capacitor(), Inductor(), VCVS(), VCCS(), CCCS(), CCVS(),
+                CoupledInductors()):
+    register_device_type(_device)
+
+
+def describe_component(component):
+    c_type, value, node1, node2 = component[:4]
+    text = f"{c_type} {get_device_type(c_type).format_value(value)} between {node1} and {node2}"
+    if len(component) > 4:
+        text += f" ({component[4]}, {component[5]})"
+    return text
+
+
+def reference_frequency(voltage_sources, current_sources):
+    """Analysis frequency: first voltage source, else first current source, else 60 Hz"""
+    if voltage_sources:
+        return voltage_sources[0][2]
+    if current_sources:
+        return current_sources[0][2]
+    return 60.0
+
+
+class DeviceGroup:
+    """All instances of one device type, with their MNA index arrays"""
+
+    def __init__(self, device, indices, nodes, values, branches):
+        self.device = device
+        self.indices = indices    # positions in the component list
+        self.nodes = nodes
+        self.values = values
+        self.branches = branches
+
+
+def _segment_sum(vals, owner, count):
+    """Sum vals (..., m) into (..., count) buckets given by owner (m,)"""
+    lead = vals.shape[:-1]
+    out = np.zeros(lead + (count,), dtype=complex)
+    if len(lead) == 0:
+        np.add.at(out, owner, vals)
+        return out
+    # np.add.at costs O(m) where bincount also pays for every bucket and
+    # splits complex weights into two strided passes
+    batch = int(np.prod(lead))
+    index = (np.arange(batch)[:, None] * count + owner).ravel()
+    np.add.at(out.reshape(-1), index, np.broadcast_to(vals, lead + (owner.size,)).reshape(-1))
+    return out
+
+
+def _accumulate(rows, cols, vals, size):
+    """Sum COO triplets into dense (..., size, size) matrices, dropping ground"""
+    keep = (rows < size) & (cols < size)
+    if not keep.all():
+        rows, cols, vals = rows[keep], cols[keep], vals[..., keep]
+    matrix = _segment_sum(vals, rows * size + cols, size * size)
+    return matrix.reshape(matrix.shape[:-1] + (size, size))
+
+
+class Factorization:
+    """Reusable factorization of one square matrix
+
+    LU with partial pivoting when SciPy is available, otherwise the explicit
+    inverse; either way later solves cost O(n^2) per right-hand side.
+    """
+
+    def __init__(self, A, overwrite=False):
+        self.dtype = A.dtype
+        if sla is not None:
+            self.lu = sla.lu_factor(A, overwrite_a=overwrite, check_finite=False)
+            if np.any(np.diag(self.lu[0]) == 0):
+                raise np.linalg.LinAlgError("Singular matrix")
+        else:
+            self.lu = None
+            self.inverse = np.linalg.inv(A)
+
+    def solve(self, b, trans=False):
+        """Solve A x = b (or A^T x = b); b may hold several columns"""
+        b = b.astype(self.dtype, copy=False)
+        if self.lu is not None:
+            return sla.lu_solve(self.lu, b, trans=int(trans), check_finite=False)
+        return (self.inverse.T if trans else self.inverse) @ b
+
+
+def _forward_adjoint_solve(A, b, E):
+    """Solve A x = b and A^T lam = E sharing one LU factorization per matrix"""
+    if sla is None:
+        x = np.linalg.solve(A, np.broadcast_to(b, A.shape[:-1])[..., None])[..., 0]
+        lam = np.linalg.solve(np.swapaxes(A, -1, -2), np.broadcast_to(E, A.shape[:-2] + E.shape))
+        return x, lam
+    size = A.shape[-1]
+    flat = A.reshape(-1, size, size)
+    x = np.empty((len(flat), size), dtype=complex)
+    lam = np.empty((len(flat),) + E.shape, dtype=complex)
+    for k, matrix in enumerate(flat):
+        factors = Factorization(matrix)
+        x[k] = factors.solve(b)
+        lam[k] = factors.solve(E, trans=True)
+    return x.reshape(A.shape[:-1]), lam.reshape(A.shape[:-2] + E.shape)
+
+
+def backward_error(A, x, b, norm=None, residual=None):
+    """Normwise backward error ||b - A x|| / (||A|| ||x|| + ||b||), infinity norms
+
+    norm (||A||) and residual (b - A x) may be passed in when the caller
+    already has them, to avoid an n x n temporary and a second product; A
+    is not used when both are given.
+    """
+    if norm is None:
+        norm = np.linalg.norm(A, np.inf)
+    if residual is None:
+        residual = b - A @ x
+    scale = norm * np.abs(x).max() + np.abs(b).max()
+    return np.abs(residual).max() / scale if scale else 0.0
+
+
+def equilibrate(A):
+    """Row and column scale factors r, c so that diag(r) A diag(c) has unit max entries"""
+    # Two passes over blocks of columns, so |A| is never held in full
+    blocks = [slice(k, k + 256) for k in range(0, A.shape[1], 256)]
+    r = np.zeros(A.shape[0])
+    for block in blocks:
+        np.maximum(r, np.abs(A[:, block]).max(axis=1, initial=0.0), out=r)
+    r = np.divide(1.0, r, out=np.ones_like(r), where=r > 0)
+    c = np.concatenate([(np.abs(A[:, block]) * r[:, None]).max(axis=0, initial=0.0) for block in blocks] or [[]])
+    c = np.divide(1.0, c, out=np.ones_like(c), where=c > 0)
+    return r, c
+
+
+def solve_mixed_precision(A, b, tol=None, max_iter=10):
+    """Solve A x = b with a complex64 factorization and complex128 refinement
+
+    A is equilibrated, factorized once in single precision, then corrected
+    with residuals of the original A computed in double precision until the
+    backward error drops below tol (default sqrt(n) * eps of float64). The
+    only n x n copy is the complex64 matrix, which is factorized in place.
+    Falls back to a double precision solve if refinement stalls. Returns
+    (x, info) where info holds precision, iterations and the achieved
+    backward_error.
+    """
+    n = A.shape[0]
+    if tol is None:
+        tol = np.sqrt(n) * np.finfo(np.float64).eps
+    r, c = equilibrate(A)
+    # diag(r) A diag(c) is computed a block of columns at a time and written
+    # straight into the single precision copy; the infinity norms of A and
+    # of the scaled matrix are summed along the way
+    scaled = np.empty(A.shape, dtype=np.complex64, order="F")
+    norm, scaled_norm = np.zeros(n), np.zeros(n)
+    for k in range(0, n, 256):
+        block = slice(k, k + 256)
+        values = A[:, block] * np.outer(r, c[block])
+        scaled[:, block] = values
+        norm += np.abs(A[:, block]).sum(axis=1)
+        scaled_norm += np.abs(values).sum(axis=1)
+    norm, scaled_norm = norm.max(initial=0.0), scaled_norm.max(initial=0.0)
+    rhs = r * b
+
+    try:
+        single = Factorization(scaled, overwrite=True)
+        del scaled
+        x = c * single.solve(rhs).astype(np.complex128)
+        previous = np.inf
+        for iteration in range(1, max_iter + 1):
+            # Convergence is judged on the equilibrated system, where a badly
+            # scaled column cannot hide the error of the other unknowns
+            residual = b - A @ x
+            error = backward_error(None, x / c, rhs, norm=scaled_norm, residual=r * residual)
+            if not np.isfinite(error) or error > 0.5 * previous:
+                break  # diverging or stagnating
+            if error <= tol:
+                return x, {"precision": "mixed", "iterations": iteration - 1,
+                           "backward_error": backward_error(A, x, b, norm=norm, residual=residual)}
+            x += c * single.solve(r * residual)
+            previous = error
+    except np.linalg.LinAlgError:
+        pass  # singular in single precision, let double precision decide
+
+    x = np.linalg.solve(A, b)
+    return x, {"precision": "double", "iterations": 0, "backward_error": backward_error(A, x, b, norm=norm)}
+
+
+class IterativeSolver:
+    """Sparse solver for very large networks under a memory budget
+
+    Small systems (size <= direct_limit, or whose estimated LU fits in
+    memory_limit bytes) are factorized directly with SuperLU. Larger ones
+    use GMRES or BiCGSTAB preconditioned with an incomplete LU sized to the
+    budget, or Jacobi scaling. Each solve warm-starts from the previous
+    solution of the same size, which pays off in sweeps. A BiCGSTAB run
+    that breaks down or stalls is retried with GMRES; if that fails too,
+    solve raises LinAlgError. The report of the last solve is kept in info,
+    with iterations counting inner steps of both methods.
+    """
+
+    BYTES_PER_ENTRY = 24  # complex value + row/column indices
+    DIRECT_FILL = 10      # assumed LU fill-in relative to nnz(A)
+
+    def __init__(self, method="gmres", preconditioner="ilu", tol=1e-10, max_iter=1000,
+                 memory_limit=None, direct_limit=2000):
+        if spla is None:
+            raise ImportError("IterativeSolver requires SciPy")
+        if method not in ("gmres", "bicgstab"):
+            raise ValueError(f"Unknown iterative method '{method}'")
+        if preconditioner not in ("ilu", "jacobi", None):
+            raise ValueError(f"Unknown preconditioner '{preconditioner}'")
+        self.method = method
+        self.preconditioner = preconditioner
+        self.tol = tol
+        self.max_iter = max_iter
+        self.memory_limit = memory_limit
+        self.direct_limit = direct_limit
+        self.previous = None
+        self.info = {}
+
+    def solve(self, A, b):
+        A = sp.csr_matrix(A)
+        n = A.shape[0]
+        direct_bytes = self.BYTES_PER_ENTRY * self.DIRECT_FILL * A.nnz
+        if n <= self.direct_limit or (self.memory_limit is not None and direct_bytes <= self.memory_limit):
+            try:
+                x = spla.splu(A.tocsc()).solve(b)
+            except RuntimeError as e:
+                raise np.linalg.LinAlgError(str(e)) from None
+            self.info = {"method": "direct", "iterations": 0, "converged": True,
+                         "residual": self._residual(A, x, b)}
+            self.previous = x
+            return x
+
+        M, used, preconditioner = self._preconditioner(A)
+        x0 = self.previous if self.previous is not None and self.previous.shape == b.shape else None
+        method = self.method
+        x, status, iterations = self._krylov(method, A, b, x0, M, used)
+        if status != 0 and method == "bicgstab":
+            # BiCGSTAB breaks down on MNA matrices whose right-hand side sits on
+            # a zero-diagonal source row (status < 0, often after 0 steps);
+            # GMRES minimizes the residual and cannot break down that way
+            method = "gmres"
+            x, status, more = self._krylov(method, A, b, x0, M, used)
+            iterations += more
+        residual = self._residual(A, x, b)
+        self.info = {"method": method, "preconditioner": preconditioner,
+                     "iterations": iterations, "converged": status == 0, "residual": residual}
+        if status != 0:
+            raise np.linalg.LinAlgError(
+                f"{method} did not converge (status {status}, residual {residual:.3g} after {iterations} iterations)")
+        self.previous = x
+        return x
+
+    def _krylov(self, method, A, b, x0, M, used):
+        """(x, status, inner iterations) of one GMRES or BiCGSTAB run
+
+        max_iter bounds inner iterations for both methods; GMRES runs whole
+        restart cycles, so it may stop up to one cycle later.
+        """
+        iterations = [0]
+
+        def count(_):
+            iterations[0] += 1
+
+        if method == "gmres":
+            n = A.shape[0]
+            restart = 50
+            if self.memory_limit is not None:
+                # Krylov basis of restart vectors must fit next to the preconditioner
+                spare = max(self.memory_limit - used, 0)
+                restart = int(np.clip(spare // (16 * n), 5, 50))
+            restart = min(restart, n)
+            x, status = spla.gmres(A, b, x0=x0, rtol=self.tol, atol=0.0, restart=restart,
+                                   maxiter=-(-self.max_iter // restart), M=M, callback=count,
+                                   callback_type="pr_norm")
+        else:
+            x, status = spla.bicgstab(A, b, x0=x0, rtol=self.tol, atol=0.0,
+                                      maxiter=self.max_iter, M=M, callback=count)
+        return x, status, iterations[0]
+
+    def _preconditioner(self, A):
+        """LinearOperator approximating A^-1, the bytes it occupies and its kind
+
+        The kind is "ilu", "jacobi" or None and names the preconditioner
+        actually built, which is Jacobi when no incomplete factor exists.
+        """
+        n = A.shape[0]
+        if self.preconditioner == "ilu":
+            fill = 10.0
+            if self.memory_limit is not None:
+                fill = float(np.clip(self.memory_limit / (2 * self.BYTES_PER_ENTRY * A.nnz), 1.0, 10.0))
+            # MNA matrices are structurally symmetric, so a symmetric ordering
+            # usually gives a far better incomplete factor than COLAMD
+            for ordering in ("MMD_AT_PLUS_A", "COLAMD"):
+                try:
+                    ilu = spla.spilu(A.tocsc(), drop_tol=1e-4, fill_factor=fill, permc_spec=ordering)
+                except RuntimeError:
+                    continue  # singular incomplete factor
+                used = self.BYTES_PER_ENTRY * (ilu.L.nnz + ilu.U.nnz)
+                return spla.LinearOperator(A.shape, ilu.solve, dtype=complex), used, "ilu"
+        if self.preconditioner is None:
+            return None, 0, None
+        # Jacobi, also the fallback when no incomplete factor could be built
+        diagonal = A.diagonal()
+        inverse = np.divide(1.0, diagonal, out=np.ones(n, dtype=complex), where=diagonal != 0)
+        return spla.LinearOperator(A.shape, lambda v: inverse * v, dtype=complex), 16 * n, "jacobi"
+
+    @staticmethod
+    def _residual(A, x, b):
+        norm = np.linalg.norm(b)
+        return np.linalg.norm(b - A @ x) / norm if norm else 0.0
+
+
+def rank_sensitivities(labels, values, output, sens):
+    """Rows (label, value, dV/dp, normalized) sorted by impact |p * dV/dp|
+
+    normalized is (p / V) dV/dp, the relative change of the output per
+    relative change of the parameter.
+    """
+    rows = []
+    for label, value, derivative in zip(labels, values, sens):
+        normalized = value * derivative / output if output != 0 else np.nan
+        rows.append((label, value, derivative, normalized))
+    rows.sort(key=lambda row: abs(row[1] * row[2]), reverse=True)
+    return rows
+
+
+def pencil_eigenvalues(G, C, k=None, target=0.0, dense_limit=500):
+    """Finite generalized eigenvalues s of (G + sC) x = 0
+
+    Dense pencils go through QZ (SciPy) or, without SciPy, through the
+    shift-inverted standard problem. Sparse pencils larger than dense_limit
+    use ARPACK in shift-invert mode and return only the k eigenvalues
+    nearest target. With k on a dense pencil the k nearest are returned too.
+    Results are sorted by distance to target.
+    """
+    n = G.shape[0]
+    if n == 0:
+        return np.empty(0, dtype=complex)
+    if sp is not None and sp.issparse(G) and k is not None and n > dense_limit:
+        G, C = G.tocsc().astype(complex), C.tocsc().astype(complex)
+        lu = spla.splu((G + target * C).tocsc())
+        op = spla.LinearOperator((n, n), matvec=lambda x: -lu.solve(C @ x), dtype=complex)
+        try:
+            mu = spla.eigs(op, k=min(k, n - 2), which="LM", return_eigenvectors=False)
+        except spla.ArpackNoConvergence as e:
+            # Fewer than k finite eigenvalues (e.g. an all-pole transfer function has no zeros)
+            mu = e.eigenvalues
+        mu = mu[np.abs(mu) > 1e-12 * np.abs(mu).max(initial=0.0)]
+        s = target + 1 / mu
+    else:
+        if sp is not None and sp.issparse(G):
+            G, C = G.toarray(), C.toarray()
+        # Balance the pencil so that finite eigenvalues are O(1) before thresholding
+        scale = (np.linalg.norm(C, 1) / np.linalg.norm(G, 1)) if np.linalg.norm(G, 1) else 1.0
+        scale = scale or 1.0
+        if sla is not None:
+            alpha, beta = sla.eig(-G, C / scale, right=False, homogeneous_eigvals=True)
+            finite = np.abs(beta) > 1e-10 * np.abs(alpha)
+            s = alpha[finite] / beta[finite] / scale
+        else:
+            shift = 1.0 + 0.5j
+            M = -np.linalg.solve(G * scale + shift * C, C)
+            mu = np.linalg.eigvals(M)
+            # Infinite eigenvalues map to mu = 0; judge against ||M|| rather than
+            # max|mu|, which is itself round-off when there is no finite one
+            mu = mu[np.abs(mu) > 1e-10 * np.linalg.norm(M, 1)]
+            s = (shift + 1 / mu) / scale
+    s = s[np.argsort(np.abs(s - target), kind="stable")]
+    return s if k is None else s[:k]
+
+
+def resonances(poles):
+    """(frequency Hz, damping ratio, Q) of each pole with Im(s) >= 0
+
+    The natural frequency is |s|; a real pole reports its corner frequency
+    and Q = 0.5. Right-half-plane poles have negative damping and Q.
+    """
+    poles = poles[poles.imag >= -1e-9 * np.abs(poles)]
+    w_n = np.abs(poles)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zeta = np.where(w_n > 0, -poles.real / w_n, 1.0)
+        q = np.where(zeta != 0, 1 / (2 * zeta), np.inf)
+    order = np.argsort(w_n, kind="stable")
+    return [(w_n[k] / (2 * np.pi), zeta[k], q[k]) for k in order]
+
+
+class BranchResults:
+    """Voltage, current and complex power of every element port
+
+    One entry per port: every port of every component (netlist order, then
+    port order), then voltage sources, then current sources. kind/owner/port
+    say which element an entry belongs to. Voltages are V(a) - V(b) across
+    the port and currents flow from a to b through the element, so
+    power = V·conj(I)/2 is the average complex power the element absorbs
+    (peak phasors) and sums to zero over the whole circuit (Tellegen).
+    """
+
+    KINDS = ("component", "voltage source", "current source")
+
+    def __init__(self, kind, owner, port, voltage, current):
+        self.kind = kind        # (P,) index into KINDS
+        self.owner = owner      # (P,) element index within its list
+        self.port = port        # (P,) port number within the element
+        self.voltage = voltage  # (..., P) complex
+        self.current = current  # (..., P) complex
+        self.power = voltage * np.conj(current) / 2
+
+    def __len__(self):
+        return len(self.kind)
+
+    @staticmethod
+    def polar(values):
+        """(magnitude, phase in degrees) of a complex array"""
+        return np.abs(values), np.degrees(np.angle(values))
+
+    def select(self, kind, port=None):
+        """Indices of the entries of one kind (optionally one port number)"""
+        mask = self.kind == self.KINDS.index(kind)
+        if port is not None:
+            mask &= self.port == port
+        return np.flatnonzero(mask)
+
+    def balance(self):
+        """(net complex power, residual relative to the power handled)"""
+        net = self.power.sum(axis=-1)
+        handled = np.abs(self.power).sum(axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            residual = np.where(handled > 0, np.abs(net) / handled, 0.0)
+        return net, residual
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Join results whose owners are already netlist indices, in KINDS/owner/port order"""
+        kind, owner, port, voltage, current = (np.concatenate([getattr(part, name) for part in parts], axis=-1)
+                                               for name in ("kind", "owner", "port", "voltage", "current"))
+        order = np.lexsort((port, owner, kind))
+        return cls(kind[order], owner[order], port[order], voltage[..., order], current[..., order])
+
+
+class MNASystem:
+    """Modified Nodal Analysis layout of a netlist
+
+    Unknowns are ordered as node voltages (sorted, GND excluded), voltage
+    source currents, then the branch currents owned by device groups.
+    With a TopologyIndex of exactly this netlist, node rows follow its node
+    IDs instead, and the type groups and terminal ID tuples are the ones
+    it keeps, so no names are collected, sorted or looked up. With one of
+    its Islands as well, the netlist is that island's: elements in the
+    order of TopologyIndex.island_netlists.
+    """
+
+    def __init__(self, components, voltage_sources=(), current_sources=(), nodes=(), topology=None,
+                 island=None):
+        self.components = list(components)
+        self.voltage_sources = list(voltage_sources)
+        self.current_sources = list(current_sources)
+
+        if topology is not None:
+            node_ids, self.node_names, layout, v_terminals, i_terminals = topology.layout(island)
+        else:
+            # Group instances by type; one pass, and the node names come from the groups
+            by_type = {}
+            for idx, comp in enumerate(self.components):
+                by_type.setdefault(comp[0], []).append(idx)
+            layout = []
+            for c_type, indices in by_type.items():
+                terminals = get_device_type(c_type).terminals
+                layout.append((c_type, indices, [self.components[k][2:2 + terminals] for k in indices]))
+            v_terminals = [s[4:6] for s in self.voltage_sources]
+            i_terminals = [s[4:6] for s in self.current_sources]
+            names = set(nodes)
+            for _, _, terminals in layout:
+                names.update(chain.from_iterable(terminals))
+            for terminals in v_terminals + i_terminals:
+                names.update(terminals)
+            names.discard("GND")
+            self.node_names = sorted(names)
+        layout = [(get_device_type(c_type), indices, terminals) for c_type, indices, terminals in layout]
+        self.node_index = {node: i for i, node in enumerate(self.node_names)}
+        self.num_nodes = len(self.node_names)
+        self.num_v_sources = len(self.voltage_sources)
+        self.size = self.num_nodes + self.num_v_sources + sum(
+            len(indices) * device.branches for device, indices, _ in layout)
+        self.ground = self.size
+
+        # Terminal rows from the topology's ascending node IDs, or by name lookup
+        if topology is not None:
+            def terminal_rows(ids, width):
+                ids = np.array(ids, dtype=np.intp).reshape(len(ids), width)
+                rows = np.searchsorted(node_ids, ids)
+                rows[ids == 0] = self.ground
+                return rows
+        else:
+            rows = dict(self.node_index, GND=self.ground)
+
+            def terminal_rows(names, width):
+                return np.array(list(map(rows.__getitem__, chain.from_iterable(names))),
+                                dtype=np.intp).reshape(len(names), width)
+
+        self.groups = []
+        self.slots = {}  # component index -> (group position, row in group)
+        next_row = self.num_nodes + self.num_v_sources
+        for device, indices, terminals in layout:
+            self.slots.update(zip(indices, zip(repeat(len(self.groups)), range(len(indices)))))
+            nodes = terminal_rows(terminals, device.terminals)
+            branches = np.arange(next_row, next_row + len(indices) * device.branches)
+            next_row += branches.size
+            values = np.array([self.components[k][1] for k in indices], dtype=float)
+            self.groups.append(DeviceGroup(device, indices, nodes, values.reshape(len(indices), device.params),
+                                           branches.reshape(len(indices), device.branches)))
+        self._ports = None
+
+        # Independent sources
+        self.v_nodes = terminal_rows(v_terminals, 2)
+        self.i_nodes = terminal_rows(i_terminals, 2)
+        self.v_rows = np.arange(self.num_nodes, self.num_nodes + self.num_v_sources)
+        self.v_units = np.exp(1j * np.radians([s[3] for s in self.voltage_sources]))
+        self.v_peaks = np.array([s[1] for s in self.voltage_sources], dtype=float)
+        self.v_phasors = self.v_peaks * self.v_units
+        self.i_units = np.exp(1j * np.radians([s[3] for s in self.current_sources]))
+        self.i_peaks = np.array([s[1] for s in self.current_sources], dtype=float)
+        self.i_phasors = self.i_peaks * self.i_units
+
+        self.frequency = reference_frequency(self.voltage_sources, self.current_sources)
+
+    def _row(self, node):
+        return self.node_index.get(node, self.ground)
+
+    def port_layout(self):
+        """Port incidence, built on first use and kept
+
+        Returns (owner, number, nodes, slots): component ports in
+        (component, port) order, and per group the (n, ports) positions of
+        its ports in those arrays.
+        """
+        if self._ports is None:
+            owners, numbers, terminals = [], [], []
+            for group in self.groups:
+                ports = np.array(group.device.ports, dtype=np.intp)
+                owners.append(np.repeat(np.array(group.indices, dtype=np.intp), len(ports)))
+                numbers.append(np.tile(np.arange(len(ports)), len(group.indices)))
+                terminals.append(group.nodes[:, ports].reshape(-1, 2))
+            owners = np.concatenate(owners or [np.empty(0, dtype=np.intp)])
+            numbers = np.concatenate(numbers or [np.empty(0, dtype=np.intp)])
+            order = np.lexsort((numbers, owners))
+            position = np.empty_like(order)
+            position[order] = np.arange(len(order))
+            slots = []
+            offset = 0
+            for group in self.groups:
+                count = len(group.indices) * len(group.device.ports)
+                slots.append(position[offset:offset + count].reshape(len(group.indices), -1))
+                offset += count
+            terminals = np.concatenate(terminals or [np.empty((0, 2), dtype=np.intp)])
+            self._ports = (owners[order], numbers[order], terminals[order], slots)
+        return self._ports
+
+    def stamps(self, omega, values=None):
+        """COO triplets of the whole MNA matrix at omega
+
+        values optionally replaces the per-group parameter arrays with
+        batched ones shaped (..., n, params), one entry per group.
+        """
+        omega = np.asarray(omega, dtype=float)
+        if omega.ndim:
+            omega = omega[..., None]
+        if values is None:
+            values = [group.values for group in self.groups]
+            lead = omega.shape[:-1]
+        else:
+            lead = np.broadcast_shapes(omega.shape[:-1], *(v.shape[:-2] for v in values))
+        m = self.v_rows
+        n1, n2 = self.v_nodes[:, 0], self.v_nodes[:, 1]
+        rows, cols, vals = _triplets([(n1, m, 1.0), (m, n1, 1.0), (n2, m, -1.0), (m, n2, -1.0)],
+                                     lead + (self.num_v_sources,))
+        stamped = [(rows, cols, vals)]
+        for group, group_values in zip(self.groups, values):
+            stamped.append(group.device.stamp(group.nodes, group_values, group.branches, omega))
+        return _triplets(stamped, lead + (rows.size,))
+
+    def assemble(self, omega, values=None):
+        """Dense MNA matrix, shaped (size, size) or (len(omega), size, size)"""
+        return _accumulate(*self.stamps(omega, values), self.size)
+
+    def rhs(self, v_peaks=None, i_peaks=None):
+        """Source vector, optionally with batched (..., m) source peaks"""
+        v = self.v_phasors if v_peaks is None else v_peaks * self.v_units
+        i = self.i_phasors if i_peaks is None else i_peaks * self.i_units
+        lead = np.broadcast_shapes(v.shape[:-1], i.shape[:-1])
+        rhs = np.zeros(lead + (self.size + 1,), dtype=complex)
+        rhs[..., self.v_rows] = v
+        injected = np.broadcast_to(np.concatenate((-i, i), axis=-1), lead + (2 * i.shape[-1],))
+        rhs += _segment_sum(injected, self.i_nodes.T.ravel(), self.size + 1)
+        return rhs[..., :self.size]
+
+    def pencil(self, sparse=False):
+        """Frequency-independent (G, C) with A(jω) = G + jωC
+
+        Inductor branches are expanded into extra rows appended after the
+        MNA unknowns, so the pencil may be larger than size.
+        """
+        m = self.v_rows
+        n1, n2 = self.v_nodes[:, 0], self.v_nodes[:, 1]
+        rows, cols, g = _triplets([(n1, m, 1.0), (m, n1, 1.0), (n2, m, -1.0), (m, n2, -1.0)],
+                                  (self.num_v_sources,))
+        all_rows, all_cols, all_g, all_c = [rows], [cols], [g], [np.zeros(g.shape)]
+        n = self.size + 1  # extra rows are numbered past ground
+        for group in self.groups:
+            count = len(group.indices) * group.device.pencil_branches
+            extra = np.arange(n, n + count).reshape(len(group.indices), group.device.pencil_branches)
+            n += count
+            rows, cols, g, c = group.device.pencil(group.nodes, group.values, group.branches, extra)
+            all_rows.append(rows)
+            all_cols.append(cols)
+            all_g.append(np.broadcast_to(g, rows.shape))
+            all_c.append(np.broadcast_to(c, rows.shape))
+        rows, cols = np.concatenate(all_rows), np.concatenate(all_cols)
+        g, c = np.concatenate(all_g), np.concatenate(all_c)
+        # Drop ground and close the gap it leaves before the extra rows
+        keep = (rows != self.ground) & (cols != self.ground)
+        rows = rows - (rows > self.ground)
+        cols = cols - (cols > self.ground)
+        n -= 1
+        rows, cols, g, c = rows[keep], cols[keep], g[keep], c[keep]
+        if sparse:
+            return tuple(sp.coo_matrix((vals, (rows, cols)), shape=(n, n)).tocsr() for vals in (g, c))
+        return tuple(_accumulate(rows, cols, vals, n).real for vals in (g, c))
+
+    def input_vector(self, source):
+        """Excitation column for ("V", k) or ("I", k), the k-th voltage/current source at 1 V or 1 A"""
+        kind, k = source
+        b = np.zeros(self.size + 1)
+        if kind == "V":
+            b[self.v_rows[k]] = 1.0
+        elif kind == "I":
+            b[self.i_nodes[k]] = (-1.0, 1.0)
+        else:
+            raise ValueError(f"Unknown source kind '{kind}'")
+        return b[:self.size]
+
+    def poles(self, k=None, target=0.0, dense_limit=500):
+        """Natural frequencies s (rad/s, complex) of the network
+
+        Circuits larger than dense_limit unknowns use a sparse shift-invert
+        eigensolver for the k poles nearest target (needs SciPy and k).
+        """
+        sparse = sp is not None and k is not None and self.size > dense_limit
+        G, C = self.pencil(sparse=sparse)
+        return pencil_eigenvalues(G, C, k, target, dense_limit)
+
+    def zeros(self, source, output, k=None, target=0.0, dense_limit=500):
+        """Transmission zeros of V(output) / source, source as in input_vector
+
+        The zeros are the finite eigenvalues of the pencil bordered with
+        the input column and output row.
+        """
+        sparse = sp is not None and k is not None and self.size > dense_limit
+        G, C = self.pencil(sparse=sparse)
+        n = G.shape[0]
+        b = np.zeros(n)
+        b[:self.size] = self.input_vector(source)
+        e = np.zeros(n)
+        e[:self.size] = self.output_selectors([output])[:, 0].real
+        if sparse:
+            G = sp.bmat([[G, sp.csr_matrix(b[:, None])], [sp.csr_matrix(e[None, :]), None]]).tocsr()
+            C = sp.bmat([[C, None], [None, sp.csr_matrix((1, 1))]]).tocsr()
+        else:
+            G = np.block([[G, b[:, None]], [e[None, :], np.zeros((1, 1))]])
+            C = np.block([[C, np.zeros((n, 1))], [np.zeros((1, n + 1))]])
+        return pencil_eigenvalues(G, C, k, target, dense_limit)
+
+    def assemble_sparse(self, omega):
+        """MNA matrix at a single omega as a SciPy CSR matrix"""
+        rows, cols, vals = self.stamps(omega)
+        keep = (rows < self.size) & (cols < self.size)
+        return sp.coo_matrix((vals[keep], (rows[keep], cols[keep])),
+                             shape=(self.size, self.size)).tocsr()
+
+    def solve(self, omega, mixed_precision=False, solver=None):
+        """Solve at one omega (or a 1-D array of them, stacked)
+
+        With mixed_precision a single omega is solved by
+        solve_mixed_precision and its report is kept in solve_info. A
+        solver such as IterativeSolver works on the sparse matrix instead.
+        """
+        if solver is not None:
+            x = solver.solve(self.assemble_sparse(omega), self.rhs())
+            self.solve_info = solver.info
+            return x
+        A = self.assemble(omega)
+        rhs = self.rhs()
+        if A.ndim == 2 and mixed_precision:
+            x, self.solve_info = solve_mixed_precision(A, rhs)
+            return x
+        if A.ndim == 2:
+            return np.linalg.solve(A, rhs)
+        return np.linalg.solve(A, np.broadcast_to(rhs, A.shape[:-1])[..., None])[..., 0]
+
+    def augmented(self, solution):
+        """Append the ground slot (0 V) so kernels can index it"""
+        return np.concatenate((solution, np.zeros(solution.shape[:-1] + (1,))), axis=-1)
+
+    def node_voltages(self, solution):
+        voltages = {"GND": 0}
+        for node, idx in self.node_index.items():
+            voltages[node] = solution[..., idx]
+        return voltages
+
+    def component_currents(self, solution, omega):
+        """Current through the first port of every component, in list order"""
+        x = self.augmented(solution)
+        omega = np.asarray(omega, dtype=float)
+        if omega.ndim:
+            omega = omega[..., None]
+        currents = np.zeros(solution.shape[:-1] + (len(self.components),), dtype=complex)
+        for group in self.groups:
+            port = group.device.currents(x, group.nodes, group.values, group.branches, omega)
+            currents[..., group.indices] = port[..., 0]
+        return currents
+
+    def source_currents(self, solution):
+        return solution[..., self.v_rows]
+
+    def branch_results(self, solution, omega, current_sources=True):
+        """BranchResults for every element port from the solution vector
+
+        Works on stacked solutions; the per-type current kernels are the
+        only loop. current_sources=False leaves independent current
+        sources out (solve_decomposed adds them for the whole netlist).
+        """
+        x = self.augmented(solution)
+        omega = np.asarray(omega, dtype=float)
+        if omega.ndim:
+            omega = omega[..., None]
+        lead = solution.shape[:-1]
+        port_owner, port_number, port_nodes, port_slots = self.port_layout()
+        ports = len(port_owner)
+        current = np.zeros(lead + (ports,), dtype=complex)
+        for group, slots in zip(self.groups, port_slots):
+            current[..., slots] = group.device.currents(x, group.nodes, group.values, group.branches, omega)
+        nodes = [port_nodes, self.v_nodes]
+        current = [current, solution[..., self.v_rows]]
+        kind = [np.zeros(ports, dtype=np.intp), np.ones(self.num_v_sources, dtype=np.intp)]
+        owner = [port_owner, np.arange(self.num_v_sources)]
+        port = [port_number, np.zeros(self.num_v_sources, dtype=np.intp)]
+        if current_sources:
+            count = len(self.current_sources)
+            nodes.append(self.i_nodes)
+            current.append(np.broadcast_to(self.i_phasors, lead + (count,)))
+            kind.append(np.full(count, 2))
+            owner.append(np.arange(count))
+            port.append(np.zeros(count, dtype=np.intp))
+        nodes = np.concatenate(nodes)
+        voltage = x[..., nodes[:, 0]] - x[..., nodes[:, 1]]
+        return BranchResults(np.concatenate(kind), np.concatenate(owner), np.concatenate(port),
+                             voltage, np.concatenate(current, axis=-1))
+
+    def parameters(self):
+        """Labels and values of every element parameter and source peak"""
+        labels, values = [], []
+        for group in self.groups:
+            for col in range(group.device.params):
+                for k, idx in enumerate(group.indices):
+                    label = describe_component(self.components[idx])
+                    if group.device.params > 1:
+                        label += f" [param {col}]"
+                    labels.append(label)
+                    values.append(group.values[k, col])
+        for s_type, peak, freq, phase, node1, node2 in self.voltage_sources:
+            labels.append(f"Voltage source {peak:.2f}V between {node1} and {node2}")
+            values.append(peak)
+        for s_type, peak, freq, phase, node1, node2 in self.current_sources:
+            labels.append(f"Current source {peak:.2f}A from {node1} to {node2}")
+            values.append(peak)
+        return labels, np.array(values, dtype=float)
+
+    def output_selectors(self, outputs):
+        """Columns e_k with V_out[k] = e_k . x; outputs are nodes or (pos, neg) pairs"""
+        E = np.zeros((self.size, len(outputs)), dtype=complex)
+        for k, out in enumerate(outputs):
+            pos, neg = (out, "GND") if isinstance(out, str) else out
+            for node, sign in ((pos, 1), (neg, -1)):
+                if node in self.node_index:
+                    E[self.node_index[node], k] += sign
+        return E
+
+    def sensitivities(self, omega, outputs):
+        """Adjoint sensitivities dV_out/dp of every output to every parameter
+
+        One forward and one transposed solve per frequency cover all outputs
+        and all parameters. omega may be a scalar or a 1-D array. Returns
+        (v_out, sens) with v_out shaped (..., outputs) and sens shaped
+        (..., outputs, parameters), parameters ordered as in parameters().
+        """
+        omega = np.asarray(omega, dtype=float)
+        E = self.output_selectors(outputs)
+        x, lam = _forward_adjoint_solve(self.assemble(omega), self.rhs(), E)
+        v_out = x @ E
+        xa = self.augmented(x)
+        la = np.concatenate((lam, np.zeros(lam.shape[:-2] + (1, len(outputs)))), axis=-2)
+        w = omega[..., None] if omega.ndim else omega
+
+        # -lam^T (dA/dp) x, summed per owning instance
+        columns = []
+        for group in self.groups:
+            n = len(group.indices)
+            for col in range(group.device.params):
+                rows, cols, dvals = group.device.stamp_derivative(
+                    group.nodes, group.values, group.branches, w, col)
+                owner = np.arange(rows.size) % n
+                contrib = dvals[..., None] * la[..., rows, :] * xa[..., cols, None]
+                columns.append(-_segment_sum(np.swapaxes(contrib, -1, -2), owner, n))
+
+        # lam^T (db/dp) for the sources
+        v_rows = self.v_rows
+        columns.append(la[..., v_rows, :].swapaxes(-1, -2) * self.v_units)
+        i_from, i_to = self.i_nodes[:, 0], self.i_nodes[:, 1]
+        columns.append((la[..., i_to, :] - la[..., i_from, :]).swapaxes(-1, -2) * self.i_units)
+        return v_out, np.concatenate(columns, axis=-1)
+
+
+# ---------------------------------------------------------------------------
+# Connectivity
+# ---------------------------------------------------------------------------
+
+class FloatingNodeError(np.linalg.LinAlgError):
+    """Raised before assembly when some islands have no path to GND"""
+
+    def __init__(self, islands):
+        self.islands = islands
+        names = "; ".join(", ".join(island) for island in islands)
+        super().__init__(f"Floating nodes with no path to GND: {names}")
+
+
+class DisjointSet:
+    """Union-find with path halving, union by size and member lists"""
+
+    def __init__(self):
+        self.parent = {}
+        self.members = {}
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.members[item] = [item]
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        self.add(a)
+        self.add(b)
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if len(self.members[a]) < len(self.members[b]):
+            a, b = b, a
+        self.parent[b] = a
+        self.members[a].extend(self.members.pop(b))
+        return a
+
+    def groups(self):
+        return list(self.members.values())
+
+
+class CircuitConnectivity:
+    """Incremental island tracking for a netlist
+
+    coupled joins every terminal of an element (GND excluded), so its sets
+    are the independent diagonal blocks of the MNA matrix. grounded joins
+    only terminal pairs with an impedance or voltage path between them; a
+    node outside GND's set there makes the matrix singular.
+    """
+
+    def __init__(self):
+        self.coupled = DisjointSet()
+        self.grounded = DisjointSet()
+        self.grounded.add("GND")
+
+    def add_component(self, component):
+        device = get_device_type(component[0])
+        terminals = component[2:2 + device.terminals]
+        self._add_terminals(terminals)
+        for a, b in device.links:
+            self.grounded.union(terminals[a], terminals[b])
+
+    def add_voltage_source(self, source):
+        self._add_terminals(source[4:6])
+        self.grounded.union(source[4], source[5])
+
+    def add_current_source(self, source):
+        # Current sources only touch the right-hand side: no coupling
+        for node in source[4:6]:
+            if node != "GND":
+                self.coupled.add(node)
+                self.grounded.add(node)
+
+    def _add_terminals(self, terminals):
+        nodes = [node for node in terminals if node != "GND"]
+        for node in nodes:
+            self.coupled.add(node)
+            self.grounded.add(node)
+        for node in nodes[1:]:
+            self.coupled.union(nodes[0], node)
+
+    @classmethod
+    def from_netlist(cls, components, voltage_sources=(), current_sources=()):
+        connectivity = cls()
+        for component in components:
+            connectivity.add_component(component)
+        for source in voltage_sources:
+            connectivity.add_voltage_source(source)
+        for source in current_sources:
+            connectivity.add_current_source(source)
+        return connectivity
+
+    def islands(self):
+        """Node sets that can be solved as separate MNA systems"""
+        return self.coupled.groups()
+
+    def island_of(self, node):
+        return self.coupled.find(node) if node != "GND" else None
+
+    def floating_islands(self):
+        """Sorted node lists of every island with no path to GND"""
+        ground = self.grounded.find("GND")
+        return sorted(sorted(members) for root, members in self.grounded.members.items()
+                      if root != ground)
+
+
+class Island:
+    """Node IDs and elements of one island of a TopologyIndex"""
+
+    def __init__(self):
+        self.nodes = []            # node ids
+        self.by_type = {}          # component type -> component indices
+        self.voltage_sources = []  # voltage source indices
+        self.current_sources = []  # (index, side): side 0 or 1 keeps only that terminal, None both
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def merge(self, other):
+        self.nodes.extend(other.nodes)
+        for c_type, indices in other.by_type.items():
+            self.by_type.setdefault(c_type, []).extend(indices)
+        self.voltage_sources.extend(other.voltage_sources)
+        self.current_sources.extend(other.current_sources)
+
+
+class TopologyIndex:
+    """Graph view of a netlist, kept up to date one element at a time
+
+    Node IDs are handed out in order of first use, GND being 0. Each add
+    updates, in O(1) per terminal: degree counts, adjacency (one edge per
+    element port), the passive two-terminal elements at every node, the
+    parallel buckets of passives sharing a node pair, the nodes where
+    exactly two passives meet (series candidates), the components of every
+    type, and the island tracking of CircuitConnectivity together with the
+    node IDs and elements of every island (the smaller of two joined
+    islands is merged into the larger). Queries read these structures
+    directly instead of rescanning the element lists.
+    """
+
+    def __init__(self):
+        self.ids = {"GND": 0}
+        self.names = ["GND"]
+        self.degree = [0]          # element terminals at each node id
+        self.adjacency = [[]]      # per node id: (neighbour id, ("C"|"V"|"I", index)) edges
+        self.passive = [[]]        # per node id: passive component indices
+        self.terminals = []        # per component: tuple of node ids
+        self.v_terminals = []
+        self.i_terminals = []
+        self.parallel = defaultdict(list)  # sorted node-name pair -> passive component indices
+        self.parallel_pairs = {}   # pairs holding two or more passives (ordered set)
+        self.series_nodes = {}     # node ids (not GND) joining two passives and nothing else (ordered set)
+        self.by_type = {}          # component type -> component indices
+        self.connectivity = CircuitConnectivity()
+        self.islands = {}          # coupled-set root name -> Island
+
+    def add_node(self, name):
+        """ID of name, registering it on first use"""
+        node_id = self.ids.get(name)
+        if node_id is None:
+            node_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.degree.append(0)
+            self.adjacency.append([])
+            self.passive.append([])
+        return node_id
+
+    def _add_element(self, key, terminals, ports):
+        ids = tuple(self.add_node(name) for name in terminals)
+        for node_id in ids:
+            self.degree[node_id] += 1
+            self.series_nodes.pop(node_id, None)
+        for a, b in ports:
+            self.adjacency[ids[a]].append((ids[b], key))
+            self.adjacency[ids[b]].append((ids[a], key))
+        return ids
+
+    def _island(self, terminals, add):
+        """Island holding terminals once add() has joined them, merging the islands it connected"""
+        coupled = self.connectivity.coupled
+        nodes = [node for node in terminals if node != "GND"]
+        joined, new = set(), []
+        for node in dict.fromkeys(nodes):
+            root = coupled.find(node) if node in coupled.parent else None
+            if root in self.islands:
+                joined.add(root)
+            else:  # first use, or only a current source so far
+                new.append(self.ids[node])
+        add()
+        if not nodes:
+            return None
+        islands = sorted((self.islands.pop(root) for root in joined), key=len, reverse=True)
+        island = islands[0] if islands else Island()
+        for other in islands[1:]:
+            island.merge(other)
+        island.nodes.extend(new)
+        self.islands[coupled.find(nodes[0])] = island
+        return island
+
+    def add_component(self, component):
+        device = get_device_type(component[0])
+        index = len(self.terminals)
+        ids = self._add_element(("C", index), component[2:2 + device.terminals], device.ports)
+        self.terminals.append(ids)
+        self.by_type.setdefault(component[0], []).append(index)
+        island = self._island(component[2:2 + device.terminals],
+                              lambda: self.connectivity.add_component(component))
+        if island is not None:
+            island.by_type.setdefault(component[0], []).append(index)
+        if device.passive:
+            for node_id in ids:
+                self.passive[node_id].append(index)
+                # A source or controlled-source terminal at the node breaks the series connection
+                if node_id != 0 and len(self.passive[node_id]) == 2 and self.degree[node_id] == 2:
+                    self.series_nodes[node_id] = None
+            pair = tuple(sorted(component[2:4]))
+            self.parallel[pair].append(index)
+            if len(self.parallel[pair]) == 2:
+                self.parallel_pairs[pair] = None
+        return index
+
+    def add_voltage_source(self, source):
+        index = len(self.v_terminals)
+        self.v_terminals.append(self._add_element(("V", index), source[4:6], ((0, 1),)))
+        island = self._island(source[4:6], lambda: self.connectivity.add_voltage_source(source))
+        if island is not None:
+            island.voltage_sources.append(index)
+
+    def add_current_source(self, source):
+        # No coupling: a source spanning two islands injects into each side
+        # against GND, which adds up to the same source if they later join
+        index = len(self.i_terminals)
+        self.i_terminals.append(self._add_element(("I", index), source[4:6], ((0, 1),)))
+        self.connectivity.add_current_source(source)
+        node1, node2 = source[4], source[5]
+        island1 = self._island((node1,), lambda: None)
+        island2 = self._island((node2,), lambda: None)
+        if island1 is island2 or island2 is None:
+            if island1 is not None:
+                island1.current_sources.append((index, None))
+        elif island1 is None:
+            island2.current_sources.append((index, None))
+        else:
+            island1.current_sources.append((index, 0))
+            island2.current_sources.append((index, 1))
+
+    @classmethod
+    def from_netlist(cls, components, voltage_sources=(), current_sources=()):
+        topology = cls()
+        for component in components:
+            topology.add_component(component)
+        for source in voltage_sources:
+            topology.add_voltage_source(source)
+        for source in current_sources:
+            topology.add_current_source(source)
+        return topology
+
+    def neighbours(self, name):
+        """(neighbour name, element key) for every port edge at a node"""
+        return [(self.names[other], key) for other, key in self.adjacency[self.ids[name]]]
+
+    def series_candidates(self):
+        """(node name, component index, component index) where two passives and nothing else meet"""
+        return [(self.names[node_id],) + tuple(self.passive[node_id]) for node_id in self.series_nodes]
+
+    def parallel_groups(self):
+        """(sorted node-name pair, passive component indices) for pairs shared by two or more"""
+        return [(pair, self.parallel[pair]) for pair in self.parallel_pairs]
+
+    def layout(self, island=None):
+        """MNA layout of the whole netlist, or of one island, from node IDs
+
+        Returns (ascending node ids, their names, [(component type, indices,
+        terminal id tuples)], voltage source and current source terminal
+        id tuples). Nodes without any element terminal get no row, nor
+        does GND. For an island, component indices count along the
+        island's own component list (see island_netlists) and a split
+        current source has GND (id 0) for its far terminal.
+        """
+        if island is None:
+            used = np.asarray(self.degree) > 0
+            used[0] = False
+            ids = np.flatnonzero(used)
+            groups = [(c_type, indices, [self.terminals[k] for k in indices])
+                      for c_type, indices in self.by_type.items()]
+            v_terminals, i_terminals = self.v_terminals, self.i_terminals
+        else:
+            ids = np.sort(np.array(island.nodes, dtype=np.intp))
+            groups = []
+            offset = 0
+            for c_type, indices in island.by_type.items():
+                groups.append((c_type, range(offset, offset + len(indices)),
+                               [self.terminals[k] for k in indices]))
+                offset += len(indices)
+            v_terminals = [self.v_terminals[k] for k in island.voltage_sources]
+            i_terminals = [self.i_terminals[k] if side is None else
+                           (self.i_terminals[k][0], 0) if side == 0 else (0, self.i_terminals[k][1])
+                           for k, side in island.current_sources]
+        return ids, [self.names[node_id] for node_id in ids], groups, v_terminals, i_terminals
+
+    def island_netlists(self, current_sources):
+        """split_netlist from the stored islands: (component indices, voltage
+        source indices, current sources, Island) per island
+
+        Component indices run type by type, as in layout(island).
+        """
+        parts = []
+        for island in self.islands.values():
+            split = []
+            for k, side in island.current_sources:
+                source = current_sources[k]
+                split.append(source if side is None else
+                             source[:5] + ("GND",) if side == 0 else source[:4] + ("GND", source[5]))
+            parts.append((list(chain.from_iterable(island.by_type.values())), island.voltage_sources,
+                          split, island))
+        return parts
+
+
+def split_netlist(components, voltage_sources, current_sources, connectivity):
+    """Partition a netlist by island
+
+    Returns a list of (component indices, voltage source indices, current
+    sources) per island. A current source spanning two islands is split into
+    one injection per side, with the far terminal replaced by GND.
+    """
+    parts = {}
+
+    def part(node):
+        root = connectivity.island_of(node)
+        if root not in parts:
+            parts[root] = ([], [], [])
+        return parts[root]
+
+    for idx, component in enumerate(components):
+        first = next(node for node in component[2:] if node != "GND")
+        part(first)[0].append(idx)
+    for idx, source in enumerate(voltage_sources):
+        part(source[4] if source[4] != "GND" else source[5])[1].append(idx)
+    for source in current_sources:
+        node1, node2 = source[4], source[5]
+        island1, island2 = connectivity.island_of(node1), connectivity.island_of(node2)
+        if island1 == island2 or island2 is None:
+            part(node1)[2].append(source)
+        elif island1 is None:
+            part(node2)[2].append(source)
+        else:
+            part(node1)[2].append(source[:5] + ("GND",))
+            part(node2)[2].append(source[:4] + ("GND", node2))
+    return list(parts.values())
+
+
+def solve_decomposed(components, voltage_sources, current_sources, omega,
+                     connectivity=None, workers=None, mixed_precision=False, solve_info=None,
+                     solver=None, branches=None, topology=None):
+    """Check connectivity, then solve every island as its own MNA system
+
+    Raises FloatingNodeError naming the islands without a path to GND.
+    Islands are solved on a thread pool when workers > 1 (a stateful sparse
+    solver keeps them sequential). Returns
+    (node voltages dict, component currents, voltage source currents) with
+    the currents in netlist order. With mixed_precision or a sparse solver,
+    the per-island solver reports are appended to the solve_info list if
+    one is given. If a branches list is given, the BranchResults of the
+    whole netlist (owners are netlist indices) is appended to it. A
+    TopologyIndex of the netlist supplies the connectivity, the island
+    element lists and the node-ID layout of every island's MNA system.
+    """
+    if topology is not None:
+        connectivity = topology.connectivity
+    if connectivity is None:
+        connectivity = CircuitConnectivity.from_netlist(components, voltage_sources, current_sources)
+    floating = connectivity.floating_islands()
+    if floating:
+        raise FloatingNodeError(floating)
+
+    def solve(part):
+        comp_idx, vs_idx, island_current_sources, island = part
+        if topology is not None and len(parts) == 1:
+            system = MNASystem(components, voltage_sources, current_sources, topology=topology)
+        else:
+            system = MNASystem([components[i] for i in comp_idx],
+                               [voltage_sources[i] for i in vs_idx], island_current_sources,
+                               topology=topology, island=island)
+        x = system.solve(omega, mixed_precision, solver)
+        return part, system, x
+
+    if topology is None:
+        parts = [part + (None,) for part in
+                 split_netlist(components, voltage_sources, current_sources, connectivity)]
+    elif len(topology.islands) == 1:
+        parts = [(np.arange(len(components)), np.arange(len(voltage_sources)), current_sources, None)]
+    else:
+        parts = topology.island_netlists(current_sources)
+    if workers and workers > 1 and len(parts) > 1 and solver is None:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            solved = list(pool.map(solve, parts))
+    else:
+        solved = [solve(part) for part in parts]
+
+    node_voltages = {"GND": 0}
+    component_currents = np.zeros(len(components), dtype=complex)
+    source_currents = np.zeros(len(voltage_sources), dtype=complex)
+    parts = []
+    for (comp_idx, vs_idx, _, _), system, x in solved:
+        if (mixed_precision or solver is not None) and solve_info is not None:
+            solve_info.append(system.solve_info)
+        node_voltages.update(system.node_voltages(x))
+        source_currents[vs_idx] = system.source_currents(x)
+        if branches is None:
+            component_currents[comp_idx] = system.component_currents(x, omega)
+            continue
+        part = system.branch_results(x, omega, current_sources=False)
+        # Island-local owners to netlist indices
+        is_component = part.kind == 0
+        part.owner = part.owner.copy()
+        part.owner[is_component] = np.array(comp_idx, dtype=np.intp)[part.owner[is_component]]
+        part.owner[~is_component] = np.array(vs_idx, dtype=np.intp)[part.owner[~is_component]]
+        # The first port of each component is its reported current: reuse it
+        # rather than running every current kernel a second time
+        first = np.flatnonzero(is_component & (part.port == 0))
+        component_currents[part.owner[first]] = part.current[..., first]
+        parts.append(part)
+    if branches is not None:
+        # Current sources may span islands, so take their voltage from the merged node voltages
+        count = len(current_sources)
+        phasors = np.array([s[1] * np.exp(1j * np.radians(s[3])) for s in current_sources], dtype=complex)
+        voltage = np.array([node_voltages.get(s[4], 0) - node_voltages.get(s[5], 0) for s in current_sources],
+                           dtype=complex)
+        parts.append(BranchResults(np.full(count, 2), np.arange(count), np.zeros(count, dtype=np.intp),
+                                   voltage, phasors))
+        branches.append(BranchResults.concatenate(parts))
+    return node_voltages, component_currents, source_currents
+
+
+# ---------------------------------------------------------------------------
+# Parameter grid sweeps
+# ---------------------------------------------------------------------------
+
+class SweepAxis:
+    """Named grid axis bound to one netlist parameter
+
+    target is "frequency" (values in Hz), ("component", index[, param]),
+    ("voltage_source", index) or ("current_source", index); component
+    values are in base units and source values are peaks.
+    """
+
+    def __init__(self, name, target, values):
+        self.name = name
+        self.target = target
+        self.values = np.asarray(values, dtype=float)
+
+    def resolve(self, system):
+        """(kind, position, param) used by the chunk solver"""
+        if self.target == "frequency":
+            return ("frequency", None, None)
+        kind, index = self.target[0], self.target[1]
+        if kind == "component":
+            if index not in system.slots:
+                raise ValueError(f"Axis '{self.name}': no component {index}")
+            return ("component", system.slots[index], self.target[2] if len(self.target) > 2 else 0)
+        if kind in ("voltage_source", "current_source"):
+            count = system.num_v_sources if kind == "voltage_source" else len(system.current_sources)
+            if not 0 <= index < count:
+                raise ValueError(f"Axis '{self.name}': no {kind.replace('_', ' ')} {index}")
+            return (kind, index, None)
+        raise ValueError(f"Axis '{self.name}': unknown target {self.target!r}")
+
+
+# Arrays a worker needs to rebuild the system, shared instead of pickled
+_SHARED_GROUP_ARRAYS = ("nodes", "values", "branches")
+_SHARED_SYSTEM_ARRAYS = ("v_nodes", "v_rows", "v_units", "v_peaks", "i_nodes", "i_units", "i_peaks")
+
+
+def _sweep_fingerprint(system, resolved, selector, chunk_size):
+    """Hash of everything that decides what a sweep stores in each result row"""
+    digest = hashlib.sha1()
+    header = [system.size, system.frequency, chunk_size]
+    arrays = [getattr(system, name) for name in _SHARED_SYSTEM_ARRAYS] + [selector]
+    for group in system.groups:
+        header.append(group.device.name)
+        arrays += [np.asarray(group.indices)] + [getattr(group, name) for name in _SHARED_GROUP_ARRAYS]
+    for kind, position, param, values in resolved:
+        header.append([kind, position, param])
+        arrays.append(values)
+    digest.update(json.dumps(header, default=str).encode("utf-8"))
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode("utf-8"))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _share_system(system, selector):
+    """Copy the system's index/value arrays into one shared memory block"""
+    arrays = {name: getattr(system, name) for name in _SHARED_SYSTEM_ARRAYS}
+    for g, group in enumerate(system.groups):
+        for name in _SHARED_GROUP_ARRAYS:
+            arrays[f"{g}.{name}"] = getattr(group, name)
+    arrays["selector"] = selector
+
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        layout[name] = (offset, array.shape, array.dtype.str)
+        offset += -(-array.nbytes // 16) * 16
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, array in arrays.items():
+        start, shape, dtype = layout[name]
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)[...] = array
+    meta = {
+        "shm": shm.name,
+        "layout": layout,
+        "devices": [group.device.name for group in system.groups],
+        "indices": [group.indices for group in system.groups],
+        "size": system.size,
+        "frequency": system.frequency,
+    }
+    return shm, meta
+
+
+def _attach_system(meta):
+    """Rebuild a solve-only MNASystem on top of a shared memory block"""
+    shm = shared_memory.SharedMemory(name=meta["shm"])
+
+    def view(name):
+        start, shape, dtype = meta["layout"][name]
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)
+
+    system = MNASystem.__new__(MNASystem)
+    for name in _SHARED_SYSTEM_ARRAYS:
+        setattr(system, name, view(name))
+    system.v_phasors = system.v_peaks * system.v_units
+    system.i_phasors = system.i_peaks * system.i_units
+    system.num_v_sources = len(system.v_rows)
+    system.size = meta["size"]
+    system.ground = meta["size"]
+    system.frequency = meta["frequency"]
+    system.groups = [DeviceGroup(get_device_type(name), indices,
+                                 *(view(f"{g}.{field}") for field in _SHARED_GROUP_ARRAYS))
+                     for g, (name, indices) in enumerate(zip(meta["devices"], meta["indices"]))]
+    return system, view("selector"), shm
+
+
+def _solve_sweep_chunk(system, selector, shape, axes, start, stop):
+    """Stacked solve of grid points [start, stop) -> outputs (stop - start, k)"""
+    coords = np.unravel_index(np.arange(start, stop), shape)
+    count = stop - start
+    omega = np.full(count, 2 * np.pi * system.frequency)
+    values = [group.values for group in system.groups]
+    v_peaks = np.repeat(system.v_peaks[None], count, axis=0)
+    i_peaks = np.repeat(system.i_peaks[None], count, axis=0)
+    for (kind, position, param, axis_values), coord in zip(axes, coords):
+        points = axis_values[coord]
+        if kind == "frequency":
+            omega = 2 * np.pi * points
+        elif kind == "component":
+            g, k = position
+            if values[g].ndim == 2:
+                values[g] = np.repeat(values[g][None], count, axis=0)
+            values[g][:, k, param] = points
+        elif kind == "voltage_source":
+            v_peaks[:, position] = points
+        else:
+            i_peaks[:, position] = points
+
+    A = system.assemble(omega, values)
+    rhs = system.rhs(v_peaks, i_peaks)
+    try:
+        x = np.linalg.solve(A, rhs[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        # Singular points somewhere in the chunk: solve one by one, NaN for those
+        x = np.full(rhs.shape, np.nan, dtype=complex)
+        for k in range(count):
+            try:
+                x[k] = np.linalg.solve(A[k], rhs[k])
+            except np.linalg.LinAlgError:
+                pass
+    return x @ selector
+
+
+_SWEEP_WORKER = {}
+
+
+def _init_sweep_worker(meta, shape, axes, results_path):
+    system, selector, shm = _attach_system(meta)
+    _SWEEP_WORKER.update(system=system, selector=selector, shm=shm, shape=shape, axes=axes,
+                         results=np.load(results_path, mmap_mode="r+"))
+
+
+def _run_sweep_chunk(chunk, start, stop):
+    state = _SWEEP_WORKER
+    state["results"][start:stop] = _solve_sweep_chunk(
+        state["system"], state["selector"], state["shape"], state["axes"], start, stop)
+    state["results"].flush()
+    return chunk
+
+
+def sweep_grid(system, axes, path, outputs=None, chunk_size=4096, workers=None, progress=None):
+    """Solve the Cartesian grid of axes, resumable, results stored under path
+
+    Points are sharded into chunks of chunk_size, each solved as one stacked
+    batch in a pool of worker processes that attach to the base topology in
+    shared memory. Chunks are written straight into path/results.npy and
+    recorded in path/done.npy, so re-running the same sweep skips finished
+    chunks. path/fingerprint.txt identifies the netlist, axes, outputs and
+    chunking; resuming with any of them changed raises ValueError.
+    outputs are node names or (pos, neg) pairs (default: all nodes).
+    Returns a read-only memmap shaped (*axis lengths, outputs).
+    """
+    if outputs is None:
+        outputs = list(system.node_names)
+    shape = tuple(len(axis.values) for axis in axes)
+    total = int(np.prod(shape))
+    resolved = [axis.resolve(system) + (axis.values,) for axis in axes]
+    selector = system.output_selectors(outputs)
+    num_chunks = -(-total // chunk_size)
+
+    os.makedirs(path, exist_ok=True)
+    results_path = os.path.join(path, "results.npy")
+    done_path = os.path.join(path, "done.npy")
+    fingerprint_path = os.path.join(path, "fingerprint.txt")
+    fingerprint = _sweep_fingerprint(system, resolved, selector, chunk_size)
+    if os.path.exists(results_path) and os.path.exists(done_path):
+        stored = None
+        if os.path.exists(fingerprint_path):
+            with open(fingerprint_path, encoding="utf-8") as f:
+                stored = f.read().strip()
+        if stored != fingerprint:
+            raise ValueError(f"Existing sweep in '{path}' was run with a different netlist, grid or outputs")
+        results = np.load(results_path, mmap_mode="r+")
+        done = np.load(done_path, mmap_mode="r+")
+        if results.shape != (total, len(outputs)) or done.shape != (num_chunks,):
+            raise ValueError(f"Existing sweep in '{path}' has a different grid")
+    else:
+        with open(fingerprint_path, "w", encoding="utf-8") as f:
+            f.write(fingerprint + "\n")
+        results = np.lib.format.open_memmap(results_path, mode="w+", dtype=complex,
+                                            shape=(total, len(outputs)))
+        results[:] = np.nan
+        results.flush()
+        done = np.lib.format.open_memmap(done_path, mode="w+", dtype=np.uint8, shape=(num_chunks,))
+
+    pending = [(c, c * chunk_size, min((c + 1) * chunk_size, total))
+               for c in range(num_chunks) if not done[c]]
+
+    def finished(chunk):
+        done[chunk] = 1
+        done.flush()
+        if progress is not None:
+            progress(int(done.sum()), num_chunks)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(pending) <= 1:
+        for chunk, start, stop in pending:
+            results[start:stop] = _solve_sweep_chunk(system, selector, shape, resolved, start, stop)
+            results.flush()
+            finished(chunk)
+    else:
+        shm, meta = _share_system(system, selector)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker,
+                                     initargs=(meta, shape, resolved, results_path)) as pool:
+                futures = [pool.submit(_run_sweep_chunk, *job) for job in pending]
+                for future in as_completed(futures):
+                    finished(future.result())
+        finally:
+            shm.close()
+            shm.unlink()
+
+    del results
+    return np.load(results_path, mmap_mode="r").reshape(shape + (len(outputs),))
+
+
+# ---------------------------------------------------------------------------
+# Streaming results
+#
+# Sources are generators that yield ResultChunk blocks as they are solved.
+# Stages take an iterable of chunks, act on each one and yield it on, so
+#   consume(write_csv(stats(stream_frequency_response(...)), "out.csv"))
+# keeps only one chunk in memory at a time.
+# ---------------------------------------------------------------------------
+
+def output_label(output):
+    return f"V({output})" if isinstance(output, str) else f"V({output[0]},{output[1]})"
+
+
+class ResultChunk:
+    """Block of solutions from a streaming analysis"""
+
+    def __init__(self, start, parameters, values, outputs):
+        self.start = start            # index of the first point in the whole run
+        self.parameters = parameters  # name -> (len,) array of swept values
+        self.values = values          # (len, outputs) complex output voltages
+        self.outputs = outputs        # output labels
+
+    def __len__(self):
+        return len(self.values)
+
+
+def stream_frequency_response(system, frequencies, outputs=None, chunk_size=256):
+    """Yield output voltages over frequencies (Hz), chunk_size stacked solves at a time"""
+    if outputs is None:
+        outputs = list(system.node_names)
+    selector = system.output_selectors(outputs)
+    labels = [output_label(out) for out in outputs]
+    frequencies = np.asarray(frequencies, dtype=float)
+    for start in range(0, len(frequencies), chunk_size):
+        block = frequencies[start:start + chunk_size]
+        x = system.solve(2 * np.pi * block)
+        yield ResultChunk(start, {"frequency": block}, x @ selector, labels)
+
+
+def stream_grid(system, axes, outputs=None, chunk_size=4096):
+    """Yield the Cartesian grid of SweepAxis values in-process, chunk by chunk"""
+    if outputs is None:
+        outputs = list(system.node_names)
+    selector = system.output_selectors(outputs)
+    labels = [output_label(out) for out in outputs]
+    shape = tuple(len(axis.values) for axis in axes)
+    total = int(np.prod(shape))
+    resolved = [axis.resolve(system) + (axis.values,) for axis in axes]
+    for start in range(0, total, chunk_size):
+        stop = min(start + chunk_size, total)
+        coords = np.unravel_index(np.arange(start, stop), shape)
+        parameters = {axis.name: axis.values[coord] for axis, coord in zip(axes, coords)}
+        values = _solve_sweep_chunk(system, selector, shape, resolved, start, stop)
+        yield ResultChunk(start, parameters, values, labels)
+
+
+def stream_circuits(netlists, outputs=None):
+    """Yield one chunk per (components, voltage_sources, current_sources) netlist"""
+    for index, (components, voltage_sources, current_sources) in enumerate(netlists):
+        omega = 2 * np.pi * reference_frequency(voltage_sources, current_sources)
+        node_voltages, _, _ = solve_decomposed(components, voltage_sources, current_sources, omega)
+        names = outputs if outputs is not None else sorted(node_voltages)
+        values = np.array([[node_voltages.get(name, np.nan) for name in names]], dtype=complex)
+        yield ResultChunk(index, {"circuit": np.array([index])}, values,
+                          [output_label(name) for name in names])
+
+
+def write_csv(chunks, path):
+    """Stage: append every chunk to a CSV file (magnitude and phase per output)"""
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = None
+        for chunk in chunks:
+            if writer is None:
+                writer = csv.writer(handle)
+                header = ["index"] + list(chunk.parameters)
+                for label in chunk.outputs:
+                    header += [f"|{label}|", f"∠{label} (deg)"]
+                writer.writerow(header)
+            magnitude = np.abs(chunk.values)
+            phase = np.degrees(np.angle(chunk.values))
+            for k in range(len(chunk)):
+                row = [chunk.start + k] + [values[k] for values in chunk.parameters.values()]
+                for m, p in zip(magnitude[k], phase[k]):
+                    row += [m, p]
+                writer.writerow(row)
+            handle.flush()
+            yield chunk
+
+
+class MagnitudeStats:
+    """Stage: running min/max and approximate percentiles of |V| per output
+
+    Percentiles come from a fixed log-spaced histogram (bins per decade), so
+    memory does not grow with the number of results.
+    """
+
+    def __init__(self, low=1e-12, high=1e6, bins_per_decade=100):
+        self.edges = np.logspace(np.log10(low), np.log10(high),
+                                 int(np.log10(high / low) * bins_per_decade) + 1)
+        self.counts = None
+        self.minimum = None
+        self.maximum = None
+        self.outputs = None
+
+    def __call__(self, chunks):
+        for chunk in chunks:
+            magnitude = np.abs(chunk.values)
+            if self.counts is None:
+                self.outputs = chunk.outputs
+                self.counts = np.zeros((len(chunk.outputs), len(self.edges) + 1), dtype=np.int64)
+                self.minimum = np.full(len(chunk.outputs), np.inf)
+                self.maximum = np.full(len(chunk.outputs), -np.inf)
+            self.minimum = np.fmin(self.minimum, np.nanmin(magnitude, axis=0, initial=np.inf))
+            self.maximum = np.fmax(self.maximum, np.nanmax(magnitude, axis=0, initial=-np.inf))
+            bins = np.searchsorted(self.edges, magnitude)
+            for k in range(magnitude.shape[1]):
+                finite = np.isfinite(magnitude[:, k])
+                self.counts[k] += np.bincount(bins[finite, k], minlength=self.counts.shape[1])
+            yield chunk
+
+    def percentile(self, q):
+        """Approximate q-th percentile of |V| for every output
+
+        The upper edge of the bin holding the percentile, clamped to the
+        observed range so that q = 0 and q = 100 give the minimum and maximum.
+        """
+        cumulative = np.cumsum(self.counts, axis=1)
+        target = cumulative[:, -1:] * q / 100.0
+        index = np.clip((cumulative < target).sum(axis=1), 1, len(self.edges) - 1)
+        return np.clip(self.edges[index], self.minimum, self.maximum)
+
+
+def plot_stream(chunks, ax, output=0, parameter=None, canvas=None, **line_kwargs):
+    """Stage: extend a magnitude line on ax as chunks arrive"""
+    line = None
+    for chunk in chunks:
+        name = parameter or next(iter(chunk.parameters))
+        x = chunk.parameters[name]
+        y = np.abs(chunk.values[:, output])
+        if line is None:
+            line, = ax.plot(x, y, label=chunk.outputs[output], **line_kwargs)
+            ax.set_xlabel(name)
+            ax.set_ylabel(f"|{chunk.outputs[output]}|")
+        else:
+            line.set_data(np.append(line.get_xdata(), x), np.append(line.get_ydata(), y))
+        ax.relim()
+        ax.autoscale_view()
+        (canvas or ax.figure.canvas).draw_idle()
+        yield chunk
+
+
+def _solve_outputs(system, frequencies, selector):
+    """Output voltages at frequencies (Hz), and the largest node voltage magnitude among them
+
+    Points with a singular matrix come back NaN.
+    """
+    omega = 2 * np.pi * frequencies
+    try:
+        x = system.solve(omega)
+    except np.linalg.LinAlgError:
+        x = np.full((len(frequencies), system.size), np.nan, dtype=complex)
+        for k, w in enumerate(omega):
+            try:
+                x[k] = system.solve(w)
+            except np.linalg.LinAlgError:
+                pass
+    peak = np.abs(x[:, :system.num_nodes])
+    peak = np.nanmax(peak, initial=0.0) if np.isfinite(peak).any() else 0.0
+    return x @ selector, peak
+
+
+def adaptive_frequency_response(system, f_min, f_max, outputs=None, tol_db=0.1, tol_deg=1.0,
+                                points_per_decade=5, max_points=2000, min_ratio=1e-6, floor=1e-12):
+    """Yield output voltages on a log-frequency grid refined where the response bends
+
+    Starts from points_per_decade log-spaced samples. Each pass solves the
+    midpoints of every unresolved interval in one stacked solve and compares
+    them with the interpolation between the endpoints (dB linear in log f,
+    phase along the shorter arc). Intervals whose midpoint misses by more
+    than tol_db or tol_deg on any output are split again; refinement stops
+    when all intervals pass, an interval is narrower than min_ratio
+    (relative), or max_points solves have been made. An output whose
+    endpoints and midpoint are all below floor times the largest node
+    voltage seen so far is numerically zero there, and its dB and phase
+    errors are ignored. One ResultChunk is yielded per pass, so samples
+    arrive out of frequency order.
+    """
+    if not 0 < f_min < f_max:
+        raise ValueError("Need 0 < f_min < f_max")
+    if outputs is None:
+        outputs = list(system.node_names)
+    selector = system.output_selectors(outputs)
+    labels = [output_label(out) for out in outputs]
+
+    decades = np.log10(f_max / f_min)
+    log_f = np.linspace(np.log10(f_min), np.log10(f_max), max(int(np.ceil(decades * points_per_decade)), 1) + 1)
+    values, peak = _solve_outputs(system, 10 ** log_f, selector)
+    yield ResultChunk(0, {"frequency": 10 ** log_f}, values, labels)
+    solved = len(log_f)
+
+    # Unresolved intervals as parallel arrays of (left, right) endpoints
+    left_f, right_f = log_f[:-1], log_f[1:]
+    left_v, right_v = values[:-1], values[1:]
+    tiny = np.finfo(float).tiny
+    while len(left_f) and solved < max_points:
+        keep = right_f - left_f > np.log10(1 + min_ratio)
+        take = np.flatnonzero(keep)[:max_points - solved]
+        left_f, right_f, left_v, right_v = left_f[take], right_f[take], left_v[take], right_v[take]
+        if not len(left_f):
+            break
+        mid_f = (left_f + right_f) / 2
+        mid_v, mid_peak = _solve_outputs(system, 10 ** mid_f, selector)
+        yield ResultChunk(solved, {"frequency": 10 ** mid_f}, mid_v, labels)
+        solved += len(mid_f)
+        peak = max(peak, mid_peak)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            db = [20 * np.log10(np.maximum(np.abs(v), tiny)) for v in (left_v, mid_v, right_v)]
+            db_error = np.abs(db[1] - (db[0] + db[2]) / 2)
+            phase = np.angle(left_v) + np.angle(right_v / left_v) / 2
+            phase_error = np.degrees(np.abs(np.angle(mid_v * np.exp(-1j * phase))))
+            negligible = np.maximum(np.maximum(np.abs(left_v), np.abs(mid_v)), np.abs(right_v)) <= floor * peak
+        # NaN (singular points) counts as unresolved
+        split = ~(((db_error <= tol_db) & (phase_error <= tol_deg)) | negligible).all(axis=1)
+        left_f = np.concatenate((left_f[split], mid_f[split]))
+        right_f = np.concatenate((mid_f[split], right_f[split]))
+        left_v = np.concatenate((left_v[split], mid_v[split]))
+        right_v = np.concatenate((mid_v[split], right_v[split]))
+
+
+class FrequencyPlot:
+    """Stage: Bode (magnitude dB, phase) and Nyquist plots of one output, redrawn per chunk
+
+    Samples are kept sorted by frequency in .frequencies and .values, so the
+    stage also collects the response of adaptive_frequency_response. Pass
+    None for any axes that should not be drawn.
+    """
+
+    def __init__(self, magnitude_ax=None, phase_ax=None, nyquist_ax=None, output=0, canvas=None):
+        self.magnitude_ax = magnitude_ax
+        self.phase_ax = phase_ax
+        self.nyquist_ax = nyquist_ax
+        self.output = output
+        self.canvas = canvas
+        self.frequencies = np.empty(0)
+        self.values = np.empty(0, dtype=complex)
+        self.lines = None
+
+    def __call__(self, chunks):
+        for chunk in chunks:
+            frequencies = np.concatenate((self.frequencies, chunk.parameters["frequency"]))
+            values = np.concatenate((self.values, chunk.values[:, self.output]))
+            order = np.argsort(frequencies, kind="stable")
+            self.frequencies, self.values = frequencies[order], values[order]
+            self.draw(chunk.outputs[self.output])
+            yield chunk
+
+    def draw(self, label):
+        with np.errstate(divide="ignore"):
+            magnitude = 20 * np.log10(np.abs(self.values))
+        phase = np.degrees(np.unwrap(np.angle(self.values)))
+        series = [(self.magnitude_ax, self.frequencies, magnitude),
+                  (self.phase_ax, self.frequencies, phase),
+                  (self.nyquist_ax, self.values.real, self.values.imag)]
+        if self.lines is None:
+            self.lines = []
+            for ax, (x_label, y_label) in zip((self.magnitude_ax, self.phase_ax, self.nyquist_ax),
+                                             (("Frequency (Hz)", f"|{label}| (dB)"),
+                                              ("Frequency (Hz)", f"∠{label} (deg)"),
+                                              (f"Re {label}", f"Im {label}"))):
+                if ax is None:
+                    self.lines.append(None)
+                    continue
+                line, = ax.plot([], [], ".-", markersize=3, linewidth=1)
+                if ax is not self.nyquist_ax:
+                    ax.set_xscale("log")
+                ax.set_xlabel(x_label)
+                ax.set_ylabel(y_label)
+                ax.grid(True, which="both", alpha=0.3)
+                self.lines.append(line)
+        for line, (ax, x, y) in zip(self.lines, series):
+            if line is None:
+                continue
+            line.set_data(x, y)
+            ax.relim()
+            ax.autoscale_view()
+        figure = next(ax.figure for ax, _, _ in series if ax is not None)
+        (self.canvas or figure.canvas).draw_idle()
+
+
+def consume(chunks):
+    """Drive a pipeline to completion, returning the number of chunks"""
+    count = 0
+    for _ in chunks:
+        count += 1
+    return count
+
+
+# ---------------------------------------------------------------------------
+# Batch solving of many small independent circuits
+# ---------------------------------------------------------------------------
+
+class CircuitSolution:
+    """Solution of one circuit from solve_batch"""
+
+    def __init__(self, node_names, voltages, source_currents, frequency):
+        self.node_names = node_names            # non-ground nodes in order of first use
+        self.voltages = voltages                # (nodes,) complex, NaN if the matrix was singular
+        self.source_currents = source_currents  # (voltage sources,) complex
+        self.frequency = frequency
+
+    @property
+    def singular(self):
+        return bool(np.isnan(self.voltages).any())
+
+    def node_voltages(self):
+        voltages = {"GND": 0}
+        voltages.update(zip(self.node_names, self.voltages))
+        return voltages
+
+
+def _batch_solve(A, b):
+    """Stacked solve; singular members come back NaN instead of failing the stack"""
+    try:
+        return np.linalg.solve(A, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        x = np.full(b.shape, np.nan, dtype=complex)
+        for k in range(len(A)):
+            try:
+                x[k] = np.linalg.solve(A[k], b[k])
+            except np.linalg.LinAlgError:
+                pass
+        return x
+
+
+def _batch_info(count, padded, started):
+    elapsed = time.perf_counter() - started
+    groups = dict(zip(*(column.tolist() for column in np.unique(padded, return_counts=True))))
+    return {"circuits": count, "groups": groups, "seconds": elapsed,
+            "circuits_per_second": count / elapsed if elapsed > 0 else float("inf")}
+
+
+def _stacked_solve(kinds, values, terminals, element_counts, num_nodes, omegas,
+                   v_terminals, v_phasors, v_counts, i_terminals, i_phasors, i_counts, pad, chunk_size):
+    """Shared engine of solve_batch and solve_batch_indexed
+
+    Takes batch-wide columns with local node IDs (ground = -1) and returns
+    (size, padded, chunks). chunks yields (circuits, x) per stacked solve,
+    where x is (len(circuits), N) with node rows first, then voltage
+    source rows, then device branch rows.
+    """
+    devices = list(DEVICE_TYPES.values())
+    count = len(num_nodes)
+    circuit_ids = np.arange(count)
+    num_v = np.asarray(v_counts, dtype=np.intp)
+    element_counts = np.asarray(element_counts, dtype=np.intp)
+    element_circuit = np.repeat(circuit_ids, element_counts)
+
+    # Branch rows follow element order within each circuit
+    branch_count = np.array([device.branches for device in devices], dtype=np.intp)[kinds]
+    branch_offset = np.cumsum(branch_count) - branch_count
+    circuit_start = np.cumsum(element_counts) - element_counts
+    if len(kinds):
+        branch_offset -= branch_offset[circuit_start[element_circuit]]
+    num_branches = np.bincount(element_circuit, weights=branch_count, minlength=count).astype(np.intp)
+    size = num_nodes + num_v + num_branches
+    padded = -(-np.maximum(size, 1) // pad) * pad
+
+    # Triplets of every circuit with local rows; ground (-1) is mapped per circuit below
+    all_circuits, all_rows, all_cols, all_vals = [], [], [], []
+    for code in np.unique(kinds):
+        device = devices[code]
+        elements = np.flatnonzero(kinds == code)
+        circuits = element_circuit[elements]
+        n = len(elements)
+        if device.params > values.shape[1]:
+            raise ValueError(f"{device.name} needs {device.params} values per element")
+        first_branch = (num_nodes + num_v)[circuits] + branch_offset[elements]
+        branches = first_branch[:, None] + np.arange(device.branches)
+        rows, cols, vals = device.stamp(terminals[elements, :device.terminals], values[elements, :device.params],
+                                        branches, omegas[circuits])
+        all_circuits.append(np.tile(circuits, rows.size // n))
+        all_rows.append(rows)
+        all_cols.append(cols)
+        all_vals.append(np.broadcast_to(vals, rows.shape))
+
+    # Source k of a circuit owns row nodes + k
+    v_circuits = np.repeat(circuit_ids, num_v)
+    v_rows = num_nodes[v_circuits] + np.arange(len(v_circuits)) - (np.cumsum(num_v) - num_v)[v_circuits]
+    v_plus, v_minus = v_terminals[:, 0], v_terminals[:, 1]
+    for row, col, sign in ((v_plus, v_rows, 1.0), (v_rows, v_plus, 1.0),
+                           (v_minus, v_rows, -1.0), (v_rows, v_minus, -1.0)):
+        all_circuits.append(v_circuits)
+        all_rows.append(row)
+        all_cols.append(col)
+        all_vals.append(np.full(len(v_circuits), sign))
+    # Ground rows and columns are not part of the stacked matrices; dropping
+    # them here saves the sort and accumulation work for those entries
+    rows, cols = np.concatenate(all_rows), np.concatenate(all_cols)
+    keep = (rows >= 0) & (cols >= 0)
+    circuit_of = np.concatenate(all_circuits)[keep]
+    rows, cols = rows[keep], cols[keep]
+    vals = np.concatenate(all_vals)[keep].astype(complex, copy=False)
+
+    # Right-hand side entries per circuit
+    i_circuits = np.repeat(circuit_ids, i_counts)
+    rhs_circuit = np.concatenate((v_circuits, i_circuits, i_circuits))
+    rhs_rows = np.concatenate((v_rows, i_terminals[:, 0], i_terminals[:, 1]))
+    rhs_vals = np.concatenate((v_phasors, -i_phasors, i_phasors))
+    keep = rhs_rows >= 0
+    rhs_circuit, rhs_rows, rhs_vals = rhs_circuit[keep], rhs_rows[keep], rhs_vals[keep]
+
+    # Slots: circuits ordered by padded size, cut into chunks of one size each
+    order = np.argsort(padded, kind="stable")
+    slot = np.empty(count, dtype=np.intp)
+    slot[order] = circuit_ids
+    chunks = []  # (first slot, last slot, padded size)
+    sorted_padded = padded[order]
+    for n in np.unique(padded):
+        first, last = np.searchsorted(sorted_padded, [n, n + 1])
+        chunks += [(start, min(start + chunk_size, last), int(n)) for start in range(first, last, chunk_size)]
+    chunk_of_slot = np.repeat(np.arange(len(chunks)), [stop - start for start, stop, _ in chunks])
+    chunk_first = np.array([start for start, _, _ in chunks], dtype=np.intp)
+
+    # Flat index of every entry inside its chunk's (batch, N, N) block;
+    # entries are then partitioned by chunk. Chunk numbers are small, so the
+    # stable sort of a narrow integer type is a radix sort.
+    chunk_of = chunk_of_slot[slot]
+    local_of = slot - chunk_first[chunk_of]
+    key_type = np.uint16 if len(chunks) < 2 ** 16 else np.intp
+    boundaries = np.arange(len(chunks) + 1)
+
+    def by_chunk(circuit, index, vals):
+        chunk = chunk_of[circuit]
+        perm = np.argsort(chunk.astype(key_type), kind="stable")
+        return np.searchsorted(chunk[perm], boundaries), index[perm], vals[perm]
+
+    n = padded[circuit_of]
+    bounds, index, vals = by_chunk(circuit_of, (local_of[circuit_of] * n + rows) * n + cols, vals)
+    n = padded[rhs_circuit]
+    rhs_bounds, rhs_index, rhs_vals = by_chunk(rhs_circuit, local_of[rhs_circuit] * n + rhs_rows, rhs_vals)
+
+    def solve_chunks():
+        for k, (start, stop, n) in enumerate(chunks):
+            batch = stop - start
+            lo, hi = bounds[k], bounds[k + 1]
+            A = _segment_sum(vals[None, lo:hi], index[lo:hi], batch * n * n)[0].reshape(batch, n, n)
+            # Unit diagonal on padding rows keeps the stacked matrices regular
+            diagonal = np.arange(n)
+            circuits = order[start:stop]
+            A[:, diagonal, diagonal] += diagonal >= size[circuits, None]
+            lo, hi = rhs_bounds[k], rhs_bounds[k + 1]
+            b = _segment_sum(rhs_vals[None, lo:hi], rhs_index[lo:hi], batch * n)[0].reshape(batch, n)
+            yield circuits, _batch_solve(A, b)
+
+    return size, padded, solve_chunks()
+
+
+def _as_codes(kinds):
+    """Device type codes (positions in DEVICE_TYPES) from an array of codes or type names"""
+    kinds = np.asarray(kinds)
+    if kinds.dtype.kind in "iu":
+        return kinds.astype(np.intp)
+    names, inverse = np.unique(kinds.astype(str), return_inverse=True)
+    codes = {name: code for code, name in enumerate(DEVICE_TYPES)}
+    return np.array([codes[get_device_type(name).name] for name in names], dtype=np.intp)[inverse].reshape(-1)
+
+
+def solve_batch_indexed(kinds, values, terminals, element_counts, num_nodes, frequencies,
+                        v_terminals=None, v_phasors=None, v_counts=None,
+                        i_terminals=None, i_phasors=None, i_counts=None, pad=4, chunk_size=4096):
+    """Array form of solve_batch for netlists that are already numbered
+
+    Elements of all circuits are concatenated circuit by circuit:
+    element_counts[c] elements belong to circuit c, which has num_nodes[c]
+    non-ground nodes. kinds holds device type names or their positions in
+    DEVICE_TYPES. values is (elements,) or (elements, params) with each
+    device's values in its leading columns. terminals is (elements, 2) or
+    (elements, 4) with local node IDs 0..num_nodes[c] - 1 and -1 for ground
+    (or unused control terminals). Sources are laid out the same way with
+    (sources, 2) terminals and complex phasors. frequencies is a scalar or
+    one value per circuit.
+
+    Skips all per-circuit Python work. Returns (voltages, source_currents,
+    info): voltages is (circuits, max nodes) and source_currents is
+    (circuits, max voltage sources), both NaN past a circuit's own count
+    and for singular circuits.
+    """
+    started = time.perf_counter()
+    kinds = _as_codes(kinds)
+    values = np.asarray(values, dtype=float).reshape(len(kinds), -1)
+    terminals = np.asarray(terminals, dtype=np.intp).reshape(len(kinds), -1)
+    if terminals.shape[1] < 4:
+        terminals = np.pad(terminals, ((0, 0), (0, 4 - terminals.shape[1])), constant_values=-1)
+    num_nodes = np.asarray(num_nodes, dtype=np.intp)
+    count = len(num_nodes)
+    omegas = 2 * np.pi * np.broadcast_to(np.asarray(frequencies, dtype=float), (count,))
+
+    def sources(source_terminals, phasors, counts):
+        if source_terminals is None:
+            return np.empty((0, 2), dtype=np.intp), np.empty(0, dtype=complex), np.zeros(count, dtype=np.intp)
+        return (np.asarray(source_terminals, dtype=np.intp).reshape(-1, 2), np.asarray(phasors, dtype=complex),
+                np.asarray(counts, dtype=np.intp))
+
+    v_terminals, v_phasors, v_counts = sources(v_terminals, v_phasors, v_counts)
+    i_terminals, i_phasors, i_counts = sources(i_terminals, i_phasors, i_counts)
+    size, padded, chunks = _stacked_solve(kinds, values, terminals, element_counts, num_nodes, omegas,
+                                          v_terminals, v_phasors, v_counts, i_terminals, i_phasors, i_counts,
+                                          pad, chunk_size)
+
+    max_nodes = int(num_nodes.max(initial=0))
+    max_v = int(v_counts.max(initial=0))
+    voltages = np.full((count, max_nodes), np.nan, dtype=complex)
+    source_currents = np.full((count, max_v), np.nan, dtype=complex)
+    for circuits, x in chunks:
+        nodes = num_nodes[circuits, None]
+        width = min(max_nodes, x.shape[1])
+        columns = np.arange(width)
+        voltages[circuits, :width] = np.where(columns < nodes, x[:, :width], np.nan)
+        columns = np.arange(max_v)
+        index = np.minimum(nodes + columns, x.shape[1] - 1)
+        source_currents[circuits] = np.where(columns < v_counts[circuits, None],
+                                             np.take_along_axis(x, index, axis=1), np.nan)
+    return voltages, source_currents, _batch_info(count, padded, started)
+
+
+def solve_batch(netlists, frequency=None, pad=4, chunk_size=4096):
+    """Solve thousands of small independent circuits with stacked dense solves
+
+    netlists yields (components, voltage_sources, current_sources). Each
+    circuit is analyzed at frequency, or at its own reference frequency.
+    Stamping is vectorized per device type across all circuits. Circuits are
+    grouped by MNA size rounded up to a multiple of pad, and each group is
+    accumulated into (chunk, N, N) arrays for one np.linalg.solve per chunk.
+    Padded rows get a unit diagonal. Returns (solutions, info), with a
+    CircuitSolution per circuit in input order and info giving the group
+    sizes, elapsed seconds and circuits per second.
+
+    Reading tuple netlists with named nodes costs a few microseconds of
+    Python per circuit; solve_batch_indexed takes pre-numbered arrays
+    instead and skips that work.
+    """
+    started = time.perf_counter()
+    codes = {name: code for code, name in enumerate(DEVICE_TYPES)}
+    devices = list(DEVICE_TYPES.values())
+    four_terminal = {name for name, device in DEVICE_TYPES.items() if device.terminals == 4}
+
+    # Flatten every netlist into batch-wide columns with zip/map, so the
+    # per-circuit Python work does not grow with the element count. Node
+    # names become local IDs per circuit (GND = -1).
+    kinds, values, plus, minus, controls = [], [], [], [], []
+    element_counts, names, omegas = [], [], []
+    v_counts, v_peaks, v_phases, v_plus, v_minus = [], [], [], [], []
+    i_counts, i_peaks, i_phases, i_plus, i_minus = [], [], [], [], []
+    empty = ((),) * 6
+    for components, voltage_sources, current_sources in netlists:
+        c_kinds, c_values, c_plus, c_minus = (list(zip(*components)) or empty)[:4]
+        v = list(zip(*voltage_sources)) or empty
+        i = list(zip(*current_sources)) or empty
+        ids = dict.fromkeys(chain(c_plus, c_minus, v[4], v[5], i[4], i[5]))
+        long = ()
+        if not four_terminal.isdisjoint(c_kinds):
+            long = [(k, c[4], c[5]) for k, c in enumerate(components) if len(c) > 4]
+            ids.update(dict.fromkeys(chain.from_iterable(entry[1:] for entry in long)))
+        ids.pop("GND", None)
+        names.append(list(ids))
+        ids = dict(zip(ids, range(len(ids))))
+        ids["GND"] = -1
+        node_id = ids.__getitem__
+
+        if long:
+            offset = len(kinds)
+            controls += [(offset + k, ids[a], ids[b]) for k, a, b in long]
+        try:
+            kinds += map(codes.__getitem__, c_kinds)
+        except KeyError as e:
+            get_device_type(e.args[0])  # raises ValueError naming the unknown type
+        values += c_values
+        plus += map(node_id, c_plus)
+        minus += map(node_id, c_minus)
+        element_counts.append(len(components))
+        v_counts.append(len(voltage_sources))
+        v_peaks += v[1]
+        v_phases += v[3]
+        v_plus += map(node_id, v[4])
+        v_minus += map(node_id, v[5])
+        i_counts.append(len(current_sources))
+        i_peaks += i[1]
+        i_phases += i[3]
+        i_plus += map(node_id, i[4])
+        i_minus += map(node_id, i[5])
+        omegas.append(2 * np.pi * (frequency if frequency is not None
+                                   else reference_frequency(voltage_sources, current_sources)))
+
+    count = len(names)
+    num_nodes = np.array(list(map(len, names)), dtype=np.intp)
+    omegas = np.array(omegas, dtype=float)
+    kinds = np.array(kinds, dtype=np.intp)
+    terminals = np.full((len(kinds), 4), -1, dtype=np.intp)
+    terminals[:, 0], terminals[:, 1] = plus, minus
+    if controls:
+        controls = np.array(controls, dtype=np.intp)
+        terminals[controls[:, 0], 2:] = controls[:, 1:]
+    # One column per device parameter; multi-parameter values such as
+    # (L1, L2, k) fill the leading columns of their row
+    width = max((devices[code].params for code in np.unique(kinds)), default=1)
+    if width == 1:
+        values = np.array(values, dtype=float).reshape(-1, 1)
+    else:
+        fill = (0.0,) * width
+        values = np.array([(*value, *fill)[:width] if isinstance(value, (tuple, list)) else (value, *fill)[:width]
+                           for value in values], dtype=float)
+
+    def phasors(peaks, phases):
+        return np.array(peaks, dtype=float) * np.exp(1j * np.radians(np.array(phases, dtype=float)))
+
+    size, padded, chunks = _stacked_solve(
+        kinds, values, terminals, element_counts, num_nodes, omegas,
+        np.array((v_plus, v_minus), dtype=np.intp).T.reshape(-1, 2), phasors(v_peaks, v_phases), v_counts,
+        np.array((i_plus, i_minus), dtype=np.intp).T.reshape(-1, 2), phasors(i_peaks, i_phases), i_counts,
+        pad, chunk_size)
+
+    solutions = [None] * count
+    nodes_list = num_nodes.tolist()
+    frequencies = (omegas / (2 * np.pi)).tolist()
+    for circuits, x in chunks:
+        for x_k, circuit in zip(x, circuits.tolist()):
+            nodes = nodes_list[circuit]
+            solutions[circuit] = CircuitSolution(names[circuit], x_k[:nodes], x_k[nodes:nodes + v_counts[circuit]],
+                                                 frequencies[circuit])
+    return solutions, _batch_info(count, padded, started)
+
+
+# ---------------------------------------------------------------------------
+# Local analysis server
+#
+# Messages are framed as two big-endian uint32 lengths (JSON header, binary
+# payload) followed by the UTF-8 JSON header and the raw payload. Arrays
+# travel in the payload as float64 (frequencies) or complex128 (results).
+# ---------------------------------------------------------------------------
+
+_FRAME = struct.Struct(">II")
+
+
+def _pack_message(header, payload=b""):
+    data = json.dumps(header).encode("utf-8")
+    return _FRAME.pack(len(data), len(payload)) + data + payload
+
+
+async def _read_message(reader):
+    header_size, payload_size = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    header = json.loads(await reader.readexactly(header_size))
+    payload = await reader.readexactly(payload_size) if payload_size else b""
+    return header, payload
+
+
+def netlist_from_json(netlist):
+    """(components, voltage_sources, current_sources) from JSON lists"""
+    components = [(c[0], tuple(c[1]) if isinstance(c[1], list) else c[1]) + tuple(c[2:])
+                  for c in netlist.get("components", [])]
+    voltage_sources = [tuple(source) for source in netlist.get("voltage_sources", [])]
+    current_sources = [tuple(source) for source in netlist.get("current_sources", [])]
+    return components, voltage_sources, current_sources
+
+
+class _ServedCircuit:
+    """A loaded netlist with its pending queries and warm factorizations"""
+
+    def __init__(self, system, cache_size):
+        self.system = system
+        self.factors = OrderedDict()  # omega -> Factorization, least recently used first
+        self.cache_size = cache_size
+        self.pending = []
+        self.busy = False
+        self.drain = None  # task answering pending queries while busy
+
+
+class AnalysisServer:
+    """Long-running asyncio server answering AC queries on loaded netlists
+
+    Clients "load" a netlist once, then send cheap "solve" queries (new
+    frequencies and/or source peaks) and "impedance" queries (port
+    impedance between two nodes). Concurrent queries for the same circuit
+    are coalesced: every frequency they need is assembled in one stacked
+    call, factorized once and kept in an LRU cache, and all right-hand
+    sides at that frequency are solved together. "stats" reports queue
+    depth, batching and latency.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, path=None, cache_size=256, max_batch=256):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self.circuits = {}
+        self.server = None
+        self.latencies = deque(maxlen=10000)
+        self.counters = defaultdict(int)
+
+    @property
+    def address(self):
+        if self.path:
+            return self.path
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def start(self):
+        if self.path:
+            self.server = await asyncio.start_unix_server(self._handle, path=self.path)
+        else:
+            self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    header, payload = await _read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                # Requests on one connection run concurrently so they can be coalesced
+                task = asyncio.ensure_future(self._respond(header, payload, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def _respond(self, header, payload, writer, lock):
+        started = time.perf_counter()
+        try:
+            response, data = await self._dispatch(header, payload)
+            response["ok"] = True
+        except Exception as e:
+            response, data = {"ok": False, "error": f"{type(e).__name__}: {e}"}, b""
+        response["id"] = header.get("id")
+        async with lock:
+            writer.write(_pack_message(response, data))
+            await writer.drain()
+        self.latencies.append(time.perf_counter() - started)
+        self.counters["requests"] += 1
+
+    async def _dispatch(self, header, payload):
+        op = header.get("op")
+        if op == "load":
+            return {"circuit": self.load(header["netlist"])}, b""
+        if op == "unload":
+            return {"removed": self.circuits.pop(header["circuit"], None) is not None}, b""
+        if op == "stats":
+            return self.stats(), b""
+        if op in ("solve", "impedance"):
+            circuit = self.circuits.get(header.get("circuit"))
+            if circuit is None:
+                raise KeyError(f"Unknown circuit {header.get('circuit')!r}, load it first")
+            if payload:
+                header["frequencies"] = np.frombuffer(payload, dtype=np.float64)
+            future = asyncio.get_running_loop().create_future()
+            circuit.pending.append((op, header, future))
+            if not circuit.busy:
+                circuit.busy = True
+                circuit.drain = asyncio.ensure_future(self._drain(circuit))
+            values, labels = await future
+            response = {"outputs": labels, "shape": list(values.shape)}
+            if header.get("binary", True):
+                return response, np.ascontiguousarray(values, dtype=np.complex128).tobytes()
+            response["values"] = np.stack((values.real, values.imag), axis=-1).tolist()
+            return response, b""
+        raise ValueError(f"Unknown op {op!r}")
+
+    def load(self, netlist):
+        key = hashlib.sha1(json.dumps(netlist, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        if key not in self.circuits:
+            self.circuits[key] = _ServedCircuit(MNASystem(*netlist_from_json(netlist)), self.cache_size)
+        return key
+
+    async def _drain(self, circuit):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while circuit.pending:
+                batch = circuit.pending[:self.max_batch]
+                del circuit.pending[:self.max_batch]
+                self.counters["batches"] += 1
+                self.counters["batched_requests"] += len(batch)
+                try:
+                    results = await loop.run_in_executor(None, self._solve_batch, circuit, batch)
+                except Exception as e:
+                    # A failure outside the per-request handling answers the whole batch
+                    results = [e] * len(batch)
+                for (_, _, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            circuit.busy = False
+            circuit.drain = None
+            # Only reached with unresolved futures when the task itself was cancelled
+            for _, _, future in chain(batch, circuit.pending):
+                if not future.done():
+                    future.cancel()
+            circuit.pending.clear()
+
+    def _factorization(self, circuit, omegas):
+        """Factorizations for every omega, assembling all cache misses in one call"""
+        missing = [w for w in omegas if w not in circuit.factors]
+        self.counters["cache_hits"] += len(omegas) - len(missing)
+        self.counters["cache_misses"] += len(missing)
+        factors = {}
+        if missing:
+            for w, A in zip(missing, circuit.system.assemble(np.array(missing))):
+                try:
+                    factors[w] = Factorization(A)
+                except np.linalg.LinAlgError as e:
+                    factors[w] = e
+                    continue
+                circuit.factors[w] = factors[w]
+                if len(circuit.factors) > circuit.cache_size:
+                    circuit.factors.popitem(last=False)
+        for w in omegas:
+            if w not in factors:
+                circuit.factors.move_to_end(w)
+                factors[w] = circuit.factors[w]
+        return factors
+
+    @staticmethod
+    def _known_nodes(system, outputs):
+        """outputs unchanged; raises KeyError for a node the circuit does not have
+
+        output_selectors skips unknown names, which would answer a misspelled
+        query with zeros.
+        """
+        for out in outputs:
+            for node in (out,) if isinstance(out, str) else out:
+                if node != "GND" and node not in system.node_index:
+                    raise KeyError(f"Unknown node {node!r}")
+        return outputs
+
+    def _solve_batch(self, circuit, batch):
+        """Solve a coalesced batch; returns (values, labels) or an exception per request"""
+        system = circuit.system
+        columns = defaultdict(list)  # omega -> [(request, row, rhs column)]
+        plans = []
+        for k, (op, header, _) in enumerate(batch):
+            try:
+                freqs = np.atleast_1d(np.asarray(header.get("frequencies", [system.frequency]), dtype=float))
+                if op == "solve":
+                    outputs = header.get("outputs") or list(system.node_names)
+                    outputs = [out if isinstance(out, str) else tuple(out) for out in outputs]
+                    v_peaks = header.get("v_peaks")
+                    i_peaks = header.get("i_peaks")
+                    rhs = system.rhs(None if v_peaks is None else np.asarray(v_peaks, dtype=float),
+                                     None if i_peaks is None else np.asarray(i_peaks, dtype=float))
+                    selector = system.output_selectors(self._known_nodes(system, outputs))
+                    labels = [output_label(out) for out in outputs]
+                else:
+                    # Unit current into the port with every independent source zeroed
+                    port = tuple(header["port"])
+                    selector = system.output_selectors(self._known_nodes(system, [port]))
+                    rhs = selector[:, 0]
+                    labels = [f"Z({port[0]},{port[1]})"]
+                for row, f in enumerate(freqs):
+                    columns[2 * np.pi * f].append((k, row, rhs))
+                plans.append((len(freqs), selector, labels))
+            except Exception as e:
+                plans.append(e)
+
+        results = [plan if isinstance(plan, Exception) else
+                   np.empty((plan[0], plan[1].shape[1]), dtype=complex) for plan in plans]
+        factors = self._factorization(circuit, list(columns))
+        for w, entries in columns.items():
+            entries = [entry for entry in entries if not isinstance(plans[entry[0]], Exception)]
+            if isinstance(factors[w], Exception):
+                for k, _, _ in entries:
+                    results[k] = factors[w]
+                continue
+            x = factors[w].solve(np.stack([rhs for _, _, rhs in entries], axis=1))
+            for column, (k, row, _) in enumerate(entries):
+                if not isinstance(results[k], Exception):
+                    results[k][row] = x[:, column] @ plans[k][1]
+        if system.size == 0:
+            results = [ValueError("Empty circuit") for _ in batch]
+        return [result if isinstance(result, Exception) else (result, plans[k][2])
+                for k, result in enumerate(results)]
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1e3
+        summary = {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        if len(latencies):
+            summary = {"mean": float(latencies.mean()), "p50": float(np.percentile(latencies, 50)),
+                       "p95": float(np.percentile(latencies, 95)), "max": float(latencies.max())}
+        return {
+            "queue_depth": sum(len(circuit.pending) for circuit in self.circuits.values()),
+            "circuits": len(self.circuits),
+            "cached_factorizations": sum(len(c.factors) for c in self.circuits.values()),
+            "latency_ms": summary,
+            **self.counters,
+        }
+
+
+class AnalysisClient:
+    """Blocking loopback client for AnalysisServer"""
+
+    def __init__(self, address, timeout=30.0):
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.next_id = 0
+
+    def close(self):
+        self.sock.close()
+
+    def _recv_exactly(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def send(self, header, payload=b""):
+        """Send one request without waiting; returns its id"""
+        self.next_id += 1
+        header = dict(header, id=self.next_id)
+        self.sock.sendall(_pack_message(header, payload))
+        return self.next_id
+
+    def receive(self):
+        header_size, payload_size = _FRAME.unpack(self._recv_exactly(_FRAME.size))
+        header = json.loads(self._recv_exactly(header_size))
+        payload = self._recv_exactly(payload_size) if payload_size else b""
+        if not header.get("ok"):
+            raise RuntimeError(header.get("error"))
+        if payload:
+            header["values"] = np.frombuffer(payload, dtype=np.complex128).reshape(header["shape"])
+        return header
+
+    def request(self, header, payload=b""):
+        self.send(header, payload)
+        return self.receive()
+
+    def load(self, components, voltage_sources=(), current_sources=()):
+        netlist = {"components": [list(c) for c in components],
+                   "voltage_sources": [list(v) for v in voltage_sources],
+                   "current_sources": [list(i) for i in current_sources]}
+        return self.request({"op": "load", "netlist": netlist})["circuit"]
+
+    def solve(self, circuit, frequencies, outputs=None, v_peaks=None, i_peaks=None):
+        header = {"op": "solve", "circuit": circuit, "outputs": outputs,
+                  "v_peaks": v_peaks, "i_peaks": i_peaks}
+        return self.request(header, np.asarray(frequencies, dtype=np.float64).tobytes())["values"]
+
+    def impedance(self, circuit, port, frequencies):
+        header = {"op": "impedance", "circuit": circuit, "port": list(port)}
+        return self.request(header, np.asarray(frequencies, dtype=np.float64).tobytes())["values"][:, 0]
+
+    def stats(self):
+        return self.request({"op": "stats"})
+
+
+def run_server(host="127.0.0.1", port=8765, path=None):
+    server = AnalysisServer(host, port, path)
+    asyncio.run(server.serve_forever())
+
+
+# ---------------------------------------------------------------------------
+# Widgets for large circuits
+# ---------------------------------------------------------------------------
+
+class VirtualList(ttk.Frame):
+    """Scrollable list that only materializes the visible rows
+
+    rows is a callable returning the current backing sequence (read on
+    every refresh, never copied); format_row turns one entry into text.
+    The listbox holds at most `height` rows and the scrollbar is driven
+    from the sequence length, so appending to a list with thousands of
+    entries costs one small redraw.
+    """
+
+    def __init__(self, parent, rows, format_row=str, height=8):
+        super().__init__(parent)
+        self.rows = rows
+        self.format_row = format_row
+        self.height = height
+        self.first = 0
+        self.pinned = True  # The end of the sequence was visible at the last refresh
+        self.listbox = tk.Listbox(self, height=height)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda e: self.scroll(-1))
+        self.listbox.bind("<Button-5>", lambda e: self.scroll(1))
+
+    def yview(self, *args):
+        """Scrollbar protocol: ("moveto", fraction) or ("scroll", n, "units"/"pages")"""
+        count = len(self.rows())
+        if args[0] == "moveto":
+            self.first = int(round(float(args[1]) * count))
+        elif args[0] == "scroll":
+            step = self.height if args[2] == "pages" else 1
+            self.first += int(args[1]) * step
+        self.refresh(follow=False)
+
+    def scroll(self, units):
+        self.yview("scroll", units, "units")
+        return "break"
+
+    def refresh(self, follow=True):
+        """Redraw the visible window; with follow, stay at the end if it was shown"""
+        rows = self.rows()
+        count = len(rows)
+        last = max(count - self.height, 0)
+        if follow and self.pinned:
+            self.first = last
+        self.first = min(max(self.first, 0), last)
+        self.pinned = self.first == last
+        self.listbox.delete(0, tk.END)
+        for row in rows[self.first:self.first + self.height]:
+            self.listbox.insert(tk.END, self.format_row(row))
+        if count:
+            self.scrollbar.set(self.first / count, min(self.first + self.height, count) / count)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+
+class NodePicker(ttk.Combobox):
+    """Type-to-search node selector
+
+    The drop-down is filled only when opened, with at most `limit` nodes
+    matching the typed text, instead of holding every node of the circuit.
+    """
+
+    def __init__(self, parent, textvariable, nodes, exclude=(), limit=50, **kwargs):
+        super().__init__(parent, textvariable=textvariable, postcommand=self.filter, **kwargs)
+        self.variable = textvariable
+        self.nodes = nodes
+        self.exclude = set(exclude)
+        self.limit = limit
+
+    def filter(self):
+        typed = self.variable.get().strip().lower()
+        nodes = [node for node in self.nodes() if node not in self.exclude]
+        matches = list(islice((node for node in nodes if typed in node.lower()), self.limit))
+        if not typed or not matches:
+            # Nothing typed yet or no match: offer the start of the list
+            matches = nodes[:self.limit]
+        self['values'] = matches
+
 
 class EnhancedACCircuitAnalyzer:
     def __init__(self, root):
@@ -19,7 +2907,10 @@ class EnhancedACCircuitAnalyzer:
         self.voltage_sources = []  # List of (type, peak, freq, phase, node1, node2)
         self.current_sources = []  # List of (type, peak, freq, phase, node1, node2)
         self.nodes = set()  # Set of node identifiers
+        self.node_order = []  # Same nodes, kept sorted for lists and pickers
         self.next_node_id = 0
+        self.topology = TopologyIndex()  # Node IDs, adjacency and islands, updated on every add
+        self.dirty = set()  # Views waiting for the next idle refresh
         
         # Initialize GUI elements first
         self.create_widgets()
@@ -49,6 +2940,8 @@ class EnhancedACCircuitAnalyzer:
         self.component_value = tk.DoubleVar(value=1000.0)
         self.node1_var = tk.StringVar()
         self.node2_var = tk.StringVar()
+        self.ctrl_node1_var = tk.StringVar()
+        self.ctrl_node2_var = tk.StringVar(value="GND")
         self.source_type = tk.StringVar(value="Sine")
         self.source_peak = tk.DoubleVar(value=10.0)
         self.source_freq = tk.DoubleVar(value=60.0)
@@ -62,6 +2955,10 @@ class EnhancedACCircuitAnalyzer:
         self.current_source_node1_var = tk.StringVar()
         self.current_source_node2_var = tk.StringVar(value="GND")
         self.new_node_name = tk.StringVar()
+        self.sensitivity_node_var = tk.StringVar()
+        self.mixed_precision = tk.BooleanVar(value=False)
+        self.response_f_min = tk.DoubleVar(value=1.0)
+        self.response_f_max = tk.DoubleVar(value=1e6)
         
         # Now create tabs
         self.create_component_tab()
@@ -84,7 +2981,7 @@ class EnhancedACCircuitAnalyzer:
         
         # Component type selection
         ttk.Label(component_tab, text="Component Type:").grid(row=0, column=0, sticky=tk.W)
-        component_types = ["Resistor", "Capacitor", "Inductor"]
+        component_types = [name for name, device in DEVICE_TYPES.items() if device.gui]
         self.type_menu = ttk.Combobox(component_tab, textvariable=self.component_type, 
                                      values=component_types, state="readonly")
         self.type_menu.grid(row=0, column=1, pady=5, sticky=tk.EW)
@@ -93,27 +2990,33 @@ class EnhancedACCircuitAnalyzer:
         ttk.Label(component_tab, text="Value:").grid(row=1, column=0, sticky=tk.W)
         self.value_entry = ttk.Entry(component_tab, textvariable=self.component_value)
         self.value_entry.grid(row=1, column=1, pady=5, sticky=tk.EW)
-        ttk.Label(component_tab, text="Ω for R, μF for C, mH for L").grid(row=2, column=0, columnspan=2, sticky=tk.W)
+        ttk.Label(component_tab, text="Ω for R, μF for C, mH for L, gain for controlled sources").grid(row=2, column=0, columnspan=2, sticky=tk.W)
         
         # Node connections
         ttk.Label(component_tab, text="Node 1:").grid(row=3, column=0, sticky=tk.W)
-        self.node1_menu = ttk.Combobox(component_tab, textvariable=self.node1_var, state="readonly")
+        self.node1_menu = NodePicker(component_tab, self.node1_var, lambda: self.node_order)
         self.node1_menu.grid(row=3, column=1, pady=5, sticky=tk.EW)
         
         ttk.Label(component_tab, text="Node 2:").grid(row=4, column=0, sticky=tk.W)
-        self.node2_menu = ttk.Combobox(component_tab, textvariable=self.node2_var, state="readonly")
+        self.node2_menu = NodePicker(component_tab, self.node2_var, lambda: self.node_order)
         self.node2_menu.grid(row=4, column=1, pady=5, sticky=tk.EW)
         
+        # Controlling nodes (only used by controlled sources)
+        ttk.Label(component_tab, text="Control +:").grid(row=5, column=0, sticky=tk.W)
+        self.ctrl_node1_menu = NodePicker(component_tab, self.ctrl_node1_var, lambda: self.node_order)
+        self.ctrl_node1_menu.grid(row=5, column=1, pady=5, sticky=tk.EW)
+        
+        ttk.Label(component_tab, text="Control -:").grid(row=6, column=0, sticky=tk.W)
+        self.ctrl_node2_menu = NodePicker(component_tab, self.ctrl_node2_var, lambda: self.node_order)
+        self.ctrl_node2_menu.grid(row=6, column=1, pady=5, sticky=tk.EW)
+        
         # Add component button
-        ttk.Button(component_tab, text="Add Component", command=self.add_component).grid(row=5, column=0, columnspan=2, pady=10)
+        ttk.Button(component_tab, text="Add Component", command=self.add_component).grid(row=7, column=0, columnspan=2, pady=10)
         
         # Component list
-        ttk.Label(component_tab, text="Current Components:").grid(row=6, column=0, columnspan=2, pady=(10,5), sticky=tk.W)
-        self.component_listbox = tk.Listbox(component_tab, height=8)
-        self.component_listbox.grid(row=7, column=0, columnspan=2, sticky=tk.EW)
-        
-        # Update node menus
-        self.update_node_menus()
+        ttk.Label(component_tab, text="Current Components:").grid(row=8, column=0, columnspan=2, pady=(10,5), sticky=tk.W)
+        self.component_list = VirtualList(component_tab, lambda: self.components, describe_component)
+        self.component_list.grid(row=9, column=0, columnspan=2, sticky=tk.EW)
     
     def create_voltage_source_tab(self):
         source_tab = ttk.Frame(self.notebook)
@@ -140,11 +3043,11 @@ class EnhancedACCircuitAnalyzer:
         
         # Node connections
         ttk.Label(source_tab, text="Positive Node:").grid(row=4, column=0, sticky=tk.W)
-        self.source_node1_menu = ttk.Combobox(source_tab, textvariable=self.source_node1_var, state="readonly")
+        self.source_node1_menu = NodePicker(source_tab, self.source_node1_var, lambda: self.node_order)
         self.source_node1_menu.grid(row=4, column=1, pady=5, sticky=tk.EW)
         
         ttk.Label(source_tab, text="Negative Node:").grid(row=5, column=0, sticky=tk.W)
-        self.source_node2_menu = ttk.Combobox(source_tab, textvariable=self.source_node2_var, state="readonly")
+        self.source_node2_menu = NodePicker(source_tab, self.source_node2_var, lambda: self.node_order)
         self.source_node2_menu.grid(row=5, column=1, pady=5, sticky=tk.EW)
         
         # Add source button
@@ -152,11 +3055,8 @@ class EnhancedACCircuitAnalyzer:
         
         # Source list
         ttk.Label(source_tab, text="Current Sources:").grid(row=7, column=0, columnspan=2, pady=(10,5), sticky=tk.W)
-        self.source_listbox = tk.Listbox(source_tab, height=8)
-        self.source_listbox.grid(row=8, column=0, columnspan=2, sticky=tk.EW)
-        
-        # Update node menus
-        self.update_node_menus()
+        self.source_list = VirtualList(source_tab, lambda: self.voltage_sources, self.describe_voltage_source)
+        self.source_list.grid(row=8, column=0, columnspan=2, sticky=tk.EW)
     
     def create_current_source_tab(self):
         source_tab = ttk.Frame(self.notebook)
@@ -183,11 +3083,11 @@ class EnhancedACCircuitAnalyzer:
         
         # Node connections
         ttk.Label(source_tab, text="From Node:").grid(row=4, column=0, sticky=tk.W)
-        self.current_source_node1_menu = ttk.Combobox(source_tab, textvariable=self.current_source_node1_var, state="readonly")
+        self.current_source_node1_menu = NodePicker(source_tab, self.current_source_node1_var, lambda: self.node_order)
         self.current_source_node1_menu.grid(row=4, column=1, pady=5, sticky=tk.EW)
         
         ttk.Label(source_tab, text="To Node:").grid(row=5, column=0, sticky=tk.W)
-        self.current_source_node2_menu = ttk.Combobox(source_tab, textvariable=self.current_source_node2_var, state="readonly")
+        self.current_source_node2_menu = NodePicker(source_tab, self.current_source_node2_var, lambda: self.node_order)
         self.current_source_node2_menu.grid(row=5, column=1, pady=5, sticky=tk.EW)
         
         # Add source button
@@ -195,11 +3095,9 @@ class EnhancedACCircuitAnalyzer:
         
         # Source list
         ttk.Label(source_tab, text="Current Sources:").grid(row=7, column=0, columnspan=2, pady=(10,5), sticky=tk.W)
-        self.current_source_listbox = tk.Listbox(source_tab, height=8)
-        self.current_source_listbox.grid(row=8, column=0, columnspan=2, sticky=tk.EW)
-        
-        # Update node menus
-        self.update_node_menus()
+        self.current_source_list = VirtualList(source_tab, lambda: self.current_sources,
+                                               self.describe_current_source)
+        self.current_source_list.grid(row=8, column=0, columnspan=2, sticky=tk.EW)
     
     def create_node_tab(self):
         node_tab = ttk.Frame(self.notebook)
@@ -214,11 +3112,8 @@ class EnhancedACCircuitAnalyzer:
         
         # Current nodes list
         ttk.Label(node_tab, text="Current Nodes:").grid(row=2, column=0, columnspan=2, pady=(10,5), sticky=tk.W)
-        self.node_listbox = tk.Listbox(node_tab, height=10)
-        self.node_listbox.grid(row=3, column=0, columnspan=2, sticky=tk.EW)
-        
-        # Update node list
-        self.update_node_list()
+        self.node_list = VirtualList(node_tab, lambda: self.node_order, height=10)
+        self.node_list.grid(row=3, column=0, columnspan=2, sticky=tk.EW)
     
     def create_analysis_controls(self, parent):
         control_frame = ttk.Frame(parent)
@@ -232,6 +3127,32 @@ class EnhancedACCircuitAnalyzer:
         
         # Detect series/parallel button
         ttk.Button(control_frame, text="Detect Series/Parallel", command=self.detect_series_parallel).pack(side=tk.LEFT, padx=5)
+        
+        # Solver options
+        options_frame = ttk.Frame(parent)
+        options_frame.pack(fill=tk.X)
+        ttk.Checkbutton(options_frame, text="Mixed precision (single LU + refinement)",
+                        variable=self.mixed_precision).pack(side=tk.LEFT, padx=5)
+        
+        # Sensitivity of the selected output node
+        sensitivity_frame = ttk.Frame(parent)
+        sensitivity_frame.pack(fill=tk.X)
+        ttk.Label(sensitivity_frame, text="Output Node:").pack(side=tk.LEFT, padx=5)
+        self.sensitivity_node_menu = NodePicker(sensitivity_frame, self.sensitivity_node_var,
+                                                lambda: self.node_order, exclude=("GND",), width=10)
+        self.sensitivity_node_menu.pack(side=tk.LEFT, padx=5)
+        ttk.Button(sensitivity_frame, text="Sensitivity", command=self.analyze_sensitivity).pack(side=tk.LEFT, padx=5)
+        ttk.Button(sensitivity_frame, text="Poles/Zeros", command=self.analyze_poles_zeros).pack(side=tk.LEFT, padx=5)
+        
+        # Adaptive frequency response of the selected output node
+        response_frame = ttk.Frame(parent)
+        response_frame.pack(fill=tk.X)
+        ttk.Label(response_frame, text="From (Hz):").pack(side=tk.LEFT, padx=5)
+        ttk.Entry(response_frame, textvariable=self.response_f_min, width=8).pack(side=tk.LEFT)
+        ttk.Label(response_frame, text="To (Hz):").pack(side=tk.LEFT, padx=5)
+        ttk.Entry(response_frame, textvariable=self.response_f_max, width=8).pack(side=tk.LEFT)
+        ttk.Button(response_frame, text="Frequency Response",
+                   command=self.plot_frequency_response).pack(side=tk.LEFT, padx=5)
     
     def create_circuit_visualization(self, parent):
         # Circuit diagram frame
@@ -268,56 +3189,53 @@ class EnhancedACCircuitAnalyzer:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.results_text.config(yscrollcommand=scrollbar.set)
     
+    def schedule_refresh(self, *views):
+        """Mark views stale; a burst of edits is redrawn once when Tk is idle"""
+        if not self.dirty:
+            self.root.after_idle(self.refresh_views)
+        self.dirty.update(views)
+    
+    def refresh_views(self):
+        views, self.dirty = self.dirty, set()
+        if "nodes" in views:
+            self.update_node_menus()
+            self.update_node_list()
+        if "components" in views:
+            self.update_component_list()
+        if "voltage_sources" in views:
+            self.update_source_list()
+        if "current_sources" in views:
+            self.update_current_source_list()
+        if "diagram" in views:
+            self.draw_circuit()
+    
     def update_node_menus(self):
-        nodes = sorted(self.nodes)
-        
-        # Only update if the widgets exist
-        if hasattr(self, 'node1_menu'):
-            self.node1_menu['values'] = nodes
-            self.node2_menu['values'] = nodes
-        
-        if hasattr(self, 'source_node1_menu'):
-            self.source_node1_menu['values'] = nodes
-            self.source_node2_menu['values'] = nodes
-        
-        if hasattr(self, 'current_source_node1_menu'):
-            self.current_source_node1_menu['values'] = nodes
-            self.current_source_node2_menu['values'] = nodes
-        
-        # Set default values if not set
-        if nodes and not self.node1_var.get():
-            self.node1_var.set(nodes[0])
+        # Pickers read self.node_order when opened; only the defaults need setting
+        if self.node_order and not self.node1_var.get():
+            self.node1_var.set(self.node_order[0])
             self.node2_var.set("GND")
     
     def update_node_list(self):
-        self.node_listbox.delete(0, tk.END)
-        for node in sorted(self.nodes):
-            self.node_listbox.insert(tk.END, node)
+        self.node_list.refresh()
     
     def update_component_list(self):
-        self.component_listbox.delete(0, tk.END)
-        for i, (c_type, value, node1, node2) in enumerate(self.components):
-            display_value = value
-            unit = "Ω"
-            
-            if c_type == "Capacitor":
-                display_value = value * 1e6  # F to μF
-                unit = "μF"
-            elif c_type == "Inductor":
-                display_value = value * 1e3  # H to mH
-                unit = "mH"
-                
-            self.component_listbox.insert(tk.END, f"{c_type} {display_value:.2f}{unit} between {node1} and {node2}")
+        self.component_list.refresh()
     
     def update_source_list(self):
-        self.source_listbox.delete(0, tk.END)
-        for i, (s_type, peak, freq, phase, node1, node2) in enumerate(self.voltage_sources):
-            self.source_listbox.insert(tk.END, f"{s_type} {peak:.2f}V {freq:.2f}Hz {phase:.2f}° between {node1} and {node2}")
+        self.source_list.refresh()
     
     def update_current_source_list(self):
-        self.current_source_listbox.delete(0, tk.END)
-        for i, (s_type, peak, freq, phase, node1, node2) in enumerate(self.current_sources):
-            self.current_source_listbox.insert(tk.END, f"{s_type} {peak:.2f}A {freq:.2f}Hz {phase:.2f}° from {node1} to {node2}")
+        self.current_source_list.refresh()
+    
+    @staticmethod
+    def describe_voltage_source(source):
+        s_type, peak, freq, phase, node1, node2 = source
+        return f"{s_type} {peak:.2f}V {freq:.2f}Hz {phase:.2f}° between {node1} and {node2}"
+    
+    @staticmethod
+    def describe_current_source(source):
+        s_type, peak, freq, phase, node1, node2 = source
+        return f"{s_type} {peak:.2f}A {freq:.2f}Hz {phase:.2f}° from {node1} to {node2}"
     
     def add_node(self, name=None):
         if name is None:
@@ -326,8 +3244,9 @@ class EnhancedACCircuitAnalyzer:
         
         if name not in self.nodes:
             self.nodes.add(name)
-            self.update_node_menus()
-            self.update_node_list()
+            bisect.insort(self.node_order, name)
+            self.topology.add_node(name)
+            self.schedule_refresh("nodes")
             return name
         return None
     
@@ -353,26 +3272,42 @@ class EnhancedACCircuitAnalyzer:
         if not node1 or not node2:
             messagebox.showerror("Error", "Please select both nodes")
             return
+        
+        unknown = [node for node in (node1, node2) if node not in self.nodes]
+        if unknown:
+            messagebox.showerror("Error", f"Unknown node '{unknown[0]}'")
+            return
             
         if node1 == node2:
             messagebox.showerror("Error", "Nodes must be different")
             return
             
-        if value <= 0:
+        device = get_device_type(c_type)
+        
+        # Gains of controlled sources may be negative (inverting)
+        if device.passive and value <= 0:
             messagebox.showerror("Error", "Component value must be positive")
             return
             
         # Convert units to base units (Ohms, Farads, Henrys)
-        if c_type == "Capacitor":
-            value = value * 1e-6  # μF to F
-        elif c_type == "Inductor":
-            value = value * 1e-3  # mH to H
-            
-        self.components.append((c_type, value, node1, node2))
+        value = value / device.scale
+        
+        if device.terminals == 4:
+            ctrl1 = self.ctrl_node1_var.get()
+            ctrl2 = self.ctrl_node2_var.get()
+            if not ctrl1 or not ctrl2 or ctrl1 == ctrl2:
+                messagebox.showerror("Error", "Please select two different control nodes")
+                return
+            if ctrl1 not in self.nodes or ctrl2 not in self.nodes:
+                messagebox.showerror("Error", "Unknown control node")
+                return
+            self.components.append((c_type, value, node1, node2, ctrl1, ctrl2))
+        else:
+            self.components.append((c_type, value, node1, node2))
+        self.topology.add_component(self.components[-1])
         
         # Update lists
-        self.update_component_list()
-        self.draw_circuit()
+        self.schedule_refresh("components", "diagram")
     
     def add_voltage_source(self):
         s_type = self.source_type.get()
@@ -385,6 +3320,11 @@ class EnhancedACCircuitAnalyzer:
         if not node1 or not node2:
             messagebox.showerror("Error", "Please select both nodes")
             return
+        
+        unknown = [node for node in (node1, node2) if node not in self.nodes]
+        if unknown:
+            messagebox.showerror("Error", f"Unknown node '{unknown[0]}'")
+            return
             
         if node1 == node2:
             messagebox.showerror("Error", "Nodes must be different")
@@ -399,10 +3339,10 @@ class EnhancedACCircuitAnalyzer:
             return
             
         self.voltage_sources.append((s_type, peak, freq, phase, node1, node2))
+        self.topology.add_voltage_source(self.voltage_sources[-1])
         
         # Update lists
-        self.update_source_list()
-        self.draw_circuit()
+        self.schedule_refresh("voltage_sources", "diagram")
     
     def add_current_source(self):
         s_type = self.current_source_type.get()
@@ -415,6 +3355,11 @@ class EnhancedACCircuitAnalyzer:
         if not node1 or not node2:
             messagebox.showerror("Error", "Please select both nodes")
             return
+        
+        unknown = [node for node in (node1, node2) if node not in self.nodes]
+        if unknown:
+            messagebox.showerror("Error", f"Unknown node '{unknown[0]}'")
+            return
             
         if node1 == node2:
             messagebox.showerror("Error", "Nodes must be different")
@@ -429,10 +3374,10 @@ class EnhancedACCircuitAnalyzer:
             return
             
         self.current_sources.append((s_type, peak, freq, phase, node1, node2))
+        self.topology.add_current_source(self.current_sources[-1])
         
         # Update lists
-        self.update_current_source_list()
-        self.draw_circuit()
+        self.schedule_refresh("current_sources", "diagram")
     
     def draw_circuit(self):
         self.circuit_ax.clear()
@@ -445,12 +3390,12 @@ class EnhancedACCircuitAnalyzer:
         
         # Create a simple grid layout for nodes
         node_positions = {}
-        num_nodes = len(self.nodes)
+        num_nodes = len(self.node_order)
         
         # Position nodes in a circle
         center = (0.5, 0.5)
         radius = 0.4
-        for i, node in enumerate(sorted(self.nodes)):
+        for i, node in enumerate(self.node_order):
             angle = 2 * np.pi * i / num_nodes
             x = center[0] + radius * np.cos(angle)
             y = center[1] + radius * np.sin(angle)
@@ -461,7 +3406,9 @@ class EnhancedACCircuitAnalyzer:
                                bbox=dict(facecolor='white', edgecolor='black', boxstyle='circle,pad=0.2'))
         
         # Draw components
-        for c_type, value, node1, node2 in self.components:
+        for component in self.components:
+            c_type, value, node1, node2 = component[:4]
+            device = get_device_type(c_type)
             x1, y1 = node_positions[node1]
             x2, y2 = node_positions[node2]
             
@@ -473,22 +3420,7 @@ class EnhancedACCircuitAnalyzer:
             mid_y = (y1 + y2) / 2
             
             # Draw component symbol
-            if c_type == "Resistor":
-                self.draw_resistor(mid_x, mid_y, x1, y1, x2, y2)
-            elif c_type == "Capacitor":
-                self.draw_capacitor(mid_x, mid_y, x1, y1, x2, y2)
-            elif c_type == "Inductor":
-                self.draw_inductor(mid_x, mid_y, x1, y1, x2, y2)
-            
-            # Label component
-            display_value = value
-            unit = "Ω"
-            if c_type == "Capacitor":
-                display_value = value * 1e6
-                unit = "μF"
-            elif c_type == "Inductor":
-                display_value = value * 1e3
-                unit = "mH"
+            getattr(self, f"draw_{device.symbol}")(mid_x, mid_y, x1, y1, x2, y2)
             
             # Calculate angle for text rotation
             angle = np.degrees(np.arctan2(y2-y1, x2-x1))
@@ -497,7 +3429,7 @@ class EnhancedACCircuitAnalyzer:
             label_x = mid_x + 0.03 * np.sin(np.arctan2(y2-y1, x2-x1))
             label_y = mid_y - 0.03 * np.cos(np.arctan2(y2-y1, x2-x1))
             
-            self.circuit_ax.text(label_x, label_y, f"{display_value:.2f}{unit}", 
+            self.circuit_ax.text(label_x, label_y, device.format_value(value), 
                                ha='center', va='center', rotation=angle)
         
         # Draw voltage sources
@@ -575,6 +3507,12 @@ class EnhancedACCircuitAnalyzer:
             circle = patches.Circle((coil_x, coil_y), coil_radius, fill=False,color='green', linewidth=1)
             self.circuit_ax.add_patch(circle)
     
+    def draw_dependent_source(self, x, y, x1, y1, x2, y2):
+        # Controlled sources use the usual diamond symbol
+        size = 0.04
+        vertices = [[x - size, y], [x, y + size], [x + size, y], [x, y - size]]
+        self.circuit_ax.add_patch(patches.Polygon(vertices, fill=False, color='purple'))
+    
     def draw_voltage_source(self, x1, y1, x2, y2, s_type, peak, freq, phase):
         # Midpoint
         mid_x = (x1 + x2) / 2
@@ -645,173 +3583,89 @@ class EnhancedACCircuitAnalyzer:
         self.results_text.insert(tk.END, "=== AC Circuit Analysis Results ===\n\n")
         
         try:
-            # Get all nodes and create index mapping (excluding ground)
-            all_nodes = sorted(self.nodes)
-            node_index = {node: i for i, node in enumerate(all_nodes) if node != "GND"}
-            num_nodes = len(node_index)
-            
-            if num_nodes == 0:
+            if not self.topology.connectivity.coupled.parent:
                 self.results_text.insert(tk.END, "No nodes to analyze (only ground exists)\n")
                 return
             
-            # Get reference frequency from first voltage source or current source
-            freq = 60.0  # default
-            if self.voltage_sources:
-                freq = self.voltage_sources[0][2]
-            elif self.current_sources:
-                freq = self.current_sources[0][2]
-            
+            # Reference frequency from first voltage source or current source
+            freq = reference_frequency(self.voltage_sources, self.current_sources)
             omega = 2 * np.pi * freq
             
-            # Initialize Modified Nodal Analysis (MNA) matrices
-            # G matrix: conductance matrix (n x n)
-            # B matrix: connection matrix for voltage sources (n x m)
-            # C matrix: connection matrix for voltage sources (m x n) (C = B^T)
-            # D matrix: zero matrix (m x m)
-            # I vector: current sources (n x 1)
-            # E vector: voltage sources (m x 1)
-            
-            # Count voltage sources
-            num_v_sources = len(self.voltage_sources)
-            
-            # Total matrix size: (n + m) x (n + m)
-            total_size = num_nodes + num_v_sources
-            G = np.zeros((total_size, total_size), dtype=complex)
-            rhs = np.zeros(total_size, dtype=complex)
-            
-            # Fill G matrix for components
-            for c_type, value, node1, node2 in self.components:
-                # Calculate admittance
-                if c_type == "Resistor":
-                    y = 1 / value
-                elif c_type == "Capacitor":
-                    y = 1j * omega * value
-                elif c_type == "Inductor":
-                    y = 1 / (1j * omega * value)
-                
-                # Update conductance matrix
-                if node1 != "GND" and node2 != "GND":
-                    i = node_index[node1]
-                    j = node_index[node2]
-                    G[i, i] += y
-                    G[j, j] += y
-                    G[i, j] -= y
-                    G[j, i] -= y
-                elif node1 != "GND":
-                    i = node_index[node1]
-                    G[i, i] += y
-                elif node2 != "GND":
-                    j = node_index[node2]
-                    G[j, j] += y
-            
-            # Process voltage sources (add to B, C, D matrices)
-            for vs_idx, (s_type, peak, freq, phase, node1, node2) in enumerate(self.voltage_sources):
-                v_complex = peak * cmath.exp(1j * np.radians(phase))
-                m = num_nodes + vs_idx  # row/col for this source
-                
-                if node1 != "GND":
-                    i = node_index[node1]
-                    G[i, m] = 1
-                    G[m, i] = 1
-                
-                if node2 != "GND":
-                    j = node_index[node2]
-                    G[j, m] = -1
-                    G[m, j] = -1
-                
-                rhs[m] = v_complex
-            
-            # Process current sources (add to I vector)
-            for s_type, peak, freq, phase, node1, node2 in self.current_sources:
-                i_complex = peak * cmath.exp(1j * np.radians(phase))
-                
-                if node1 != "GND" and node2 != "GND":
-                    i = node_index[node1]
-                    j = node_index[node2]
-                    rhs[i] -= i_complex
-                    rhs[j] += i_complex
-                elif node1 != "GND":
-                    i = node_index[node1]
-                    rhs[i] -= i_complex
-                elif node2 != "GND":
-                    j = node_index[node2]
-                    rhs[j] += i_complex
-            
-            # Solve the system
+            # Check connectivity, then solve each island separately
+            solve_info = []
+            branches = []
             try:
-                solution = np.linalg.solve(G, rhs)
+                node_voltages, currents, source_currents = solve_decomposed(
+                    self.components, self.voltage_sources, self.current_sources, omega,
+                    mixed_precision=self.mixed_precision.get(), solve_info=solve_info, branches=branches,
+                    topology=self.topology)
+            except FloatingNodeError as e:
+                self.report_floating_islands(e.islands)
+                return
             except np.linalg.LinAlgError:
                 self.results_text.insert(tk.END, "Matrix is singular - check your circuit connections\n")
                 return
             
-            # Extract node voltages
-            node_voltages = {node: 0 for node in all_nodes}
-            node_voltages["GND"] = 0
-            for node, idx in node_index.items():
-                node_voltages[node] = solution[idx]
-            
-            # Extract voltage source currents
-            source_currents = {}
-            for vs_idx, (s_type, peak, freq, phase, node1, node2) in enumerate(self.voltage_sources):
-                m = num_nodes + vs_idx
-                source_currents[(node1, node2)] = solution[m]
-            
             # Display results
             self.results_text.insert(tk.END, f"Analysis Frequency: {freq:.2f} Hz\n\n")
             
-            self.results_text.insert(tk.END, "=== Node Voltages ===\n")
-            for node in sorted(node_voltages.keys()):
-                v = node_voltages[node]
-                self.results_text.insert(tk.END, 
-                    f"{node}: {abs(v):.4f}V ∠{np.degrees(cmath.phase(v)):.2f}°\n")
+            if solve_info:
+                fallbacks = sum(info["precision"] == "double" for info in solve_info)
+                worst = max(info["backward_error"] for info in solve_info)
+                solver = "mixed precision" if not fallbacks else \
+                    f"mixed precision ({fallbacks} island(s) fell back to double)"
+                self.results_text.insert(tk.END, f"Solver: {solver}, backward error {worst:.2e}\n\n")
             
-            self.results_text.insert(tk.END, "\n=== Component Currents ===\n")
-            for c_type, value, node1, node2 in self.components:
-                v1 = node_voltages[node1]
-                v2 = node_voltages[node2]
-                v_diff = v1 - v2
-                
-                # Calculate impedance
-                if c_type == "Resistor":
-                    z = value
-                elif c_type == "Capacitor":
-                    z = 1 / (1j * omega * value)
-                elif c_type == "Inductor":
-                    z = 1j * omega * value
-                
-                # Calculate current
-                current = v_diff / z
-                
-                display_value = value
-                unit = "Ω"
-                if c_type == "Capacitor":
-                    display_value = value * 1e6
-                    unit = "μF"
-                elif c_type == "Inductor":
-                    display_value = value * 1e3
-                    unit = "mH"
-                
-                self.results_text.insert(tk.END, 
-                    f"{c_type} {display_value:.2f}{unit} between {node1} and {node2}: "
-                    f"{abs(current):.4f}A ∠{np.degrees(cmath.phase(current)):.2f}°\n")
+            unconnected = sorted(self.nodes - node_voltages.keys())
+            if unconnected:
+                self.results_text.insert(tk.END, f"Unconnected nodes (ignored): {', '.join(unconnected)}\n\n")
+            
+            # Magnitudes, phases and powers for every element at once; only formatting loops
+            branches = branches[0]
+            names = sorted(node_voltages.keys())
+            magnitude, phase = BranchResults.polar(np.array([node_voltages[node] for node in names], dtype=complex))
+            lines = ["=== Node Voltages ==="]
+            lines += [f"{node}: {m:.4f}V ∠{p:.2f}°" for node, m, p in zip(names, magnitude, phase)]
+            
+            lines.append("\n=== Component Currents ===")
+            rows = branches.select("component", port=0)
+            magnitude, phase = BranchResults.polar(branches.current[rows])
+            lines += [f"{describe_component(self.components[k])}: {m:.4f}A ∠{p:.2f}°"
+                      for k, m, p in zip(branches.owner[rows], magnitude, phase)]
             
             if self.voltage_sources:
-                self.results_text.insert(tk.END, "\n=== Voltage Source Currents ===\n")
-                for vs_idx, (s_type, peak, freq, phase, node1, node2) in enumerate(self.voltage_sources):
-                    current = source_currents[(node1, node2)]
-                    self.results_text.insert(tk.END, 
-                        f"Source {peak:.2f}V {freq:.2f}Hz ∠{phase:.2f}° between {node1} and {node2}: "
-                        f"{abs(current):.4f}A ∠{np.degrees(cmath.phase(current)):.2f}°\n")
+                lines.append("\n=== Voltage Source Currents ===")
+                rows = branches.select("voltage source")
+                magnitude, phase = BranchResults.polar(branches.current[rows])
+                for k, m, p in zip(branches.owner[rows], magnitude, phase):
+                    s_type, peak, s_freq, s_phase, node1, node2 = self.voltage_sources[k]
+                    lines.append(f"Source {peak:.2f}V {s_freq:.2f}Hz ∠{s_phase:.2f}° between {node1} and {node2}: "
+                                 f"{m:.4f}A ∠{p:.2f}°")
             
             if self.current_sources:
-                self.results_text.insert(tk.END, "\n=== Current Source Voltages ===\n")
-                for s_type, peak, freq, phase, node1, node2 in self.current_sources:
-                    v1 = node_voltages[node1]
-                    v2 = node_voltages[node2]
-                    v_diff = v1 - v2
-                    self.results_text.insert(tk.END, 
-                        f"Source {peak:.2f}A {freq:.2f}Hz ∠{phase:.2f}° between {node1} and {node2}: "
-                        f"{abs(v_diff):.4f}V ∠{np.degrees(cmath.phase(v_diff)):.2f}°\n")
+                lines.append("\n=== Current Source Voltages ===")
+                rows = branches.select("current source")
+                magnitude, phase = BranchResults.polar(branches.voltage[rows])
+                for k, m, p in zip(branches.owner[rows], magnitude, phase):
+                    s_type, peak, s_freq, s_phase, node1, node2 = self.current_sources[k]
+                    lines.append(f"Source {peak:.2f}A {s_freq:.2f}Hz ∠{s_phase:.2f}° between {node1} and {node2}: "
+                                 f"{m:.4f}V ∠{p:.2f}°")
+            
+            lines.append("\n=== Complex Power (absorbed, average) ===")
+            power = branches.power
+            for k, (kind, owner, port) in enumerate(zip(branches.kind, branches.owner, branches.port)):
+                if kind == 0:
+                    name = describe_component(self.components[owner])
+                    if len(get_device_type(self.components[owner][0]).ports) > 1:
+                        name += f" [port {port}]"
+                else:
+                    source = (self.voltage_sources if kind == 1 else self.current_sources)[owner]
+                    name = f"{BranchResults.KINDS[kind].capitalize()} between {source[4]} and {source[5]}"
+                lines.append(f"{name}: P = {power[k].real:.4g}W, Q = {power[k].imag:.4g}var")
+            net, residual = branches.balance()
+            lines.append(f"Power balance (Tellegen): ΣS = {net.real:.3g}{net.imag:+.3g}j VA, "
+                         f"relative residual {residual:.2e}")
+            self.results_text.insert(tk.END, "\n".join(lines) + "\n")
             
             # Calculate and display equivalent impedances for series/parallel components
             self.calculate_equivalent_impedances(freq)
@@ -819,6 +3673,156 @@ class EnhancedACCircuitAnalyzer:
         except Exception as e:
             self.results_text.insert(tk.END, f"\nError in analysis: {str(e)}\n")
     
+    def report_floating_islands(self, islands):
+        self.results_text.insert(tk.END, "Matrix is singular - these nodes have no path to GND:\n")
+        for k, island in enumerate(islands, 1):
+            self.results_text.insert(tk.END, f"  Island {k}: {', '.join(island)}\n")
+        self.results_text.insert(tk.END, "Connect each island to GND (e.g. ground one of its nodes)\n")
+    
+    def analyze_sensitivity(self):
+        """Rank every parameter by its influence on the selected node voltage"""
+        output = self.sensitivity_node_var.get()
+        if not output:
+            messagebox.showerror("Error", "Please select an output node")
+            return
+        if not self.components and not self.voltage_sources and not self.current_sources:
+            messagebox.showerror("Error", "No components or sources to analyze")
+            return
+        
+        self.results_text.insert(tk.END, f"\n=== Sensitivity of V({output}) ===\n")
+        try:
+            floating = self.topology.connectivity.floating_islands()
+            if floating:
+                self.report_floating_islands(floating)
+                return
+            system = MNASystem(self.components, self.voltage_sources, self.current_sources,
+                               topology=self.topology)
+            if output not in system.node_index:
+                self.results_text.insert(tk.END, f"Node {output} is not connected to any element\n")
+                return
+            omega = 2 * np.pi * system.frequency
+            try:
+                v_out, sens = system.sensitivities(omega, [output])
+            except np.linalg.LinAlgError:
+                self.results_text.insert(tk.END, "Matrix is singular - check your circuit connections\n")
+                return
+            
+            labels, values = system.parameters()
+            v = v_out[0]
+            self.results_text.insert(tk.END, 
+                f"V({output}) = {abs(v):.4f}V ∠{np.degrees(cmath.phase(v)):.2f}° at {system.frequency:.2f} Hz\n")
+            self.results_text.insert(tk.END, "Ranked by |p·dV/dp| (change in V per 100% change in p):\n")
+            for label, value, derivative, normalized in rank_sensitivities(labels, values, v, sens[0]):
+                self.results_text.insert(tk.END, 
+                    f"{label}: dV/dp = {abs(derivative):.4g} ∠{np.degrees(cmath.phase(derivative)):.2f}°, "
+                    f"normalized {abs(normalized):.4f}\n")
+        except Exception as e:
+            self.results_text.insert(tk.END, f"\nError in analysis: {str(e)}\n")
+    
+    def analyze_poles_zeros(self, max_poles=10):
+        """Natural frequencies of the network and zeros from the first source to the output node"""
+        output = self.sensitivity_node_var.get()
+        if not output:
+            messagebox.showerror("Error", "Please select an output node")
+            return
+        if not self.voltage_sources and not self.current_sources:
+            messagebox.showerror("Error", "Add a voltage or current source to act as the input")
+            return
+        
+        self.results_text.insert(tk.END, f"\n=== Poles and Zeros of V({output}) ===\n")
+        try:
+            floating = self.topology.connectivity.floating_islands()
+            if floating:
+                self.report_floating_islands(floating)
+                return
+            system = MNASystem(self.components, self.voltage_sources, self.current_sources,
+                               topology=self.topology)
+            if output not in system.node_index:
+                self.results_text.insert(tk.END, f"Node {output} is not connected to any element\n")
+                return
+            source = ("V", 0) if self.voltage_sources else ("I", 0)
+            s_type, peak, freq, phase, node1, node2 = (self.voltage_sources or self.current_sources)[0]
+            
+            # Large circuits: only the poles nearest the source frequency
+            k = max_poles if system.size > 500 else None
+            target = 2j * np.pi * system.frequency if k else 0.0
+            poles = system.poles(k, target)
+            zeros = system.zeros(source, output, k, target)
+            
+            self.results_text.insert(tk.END, f"Input: source between {node1} and {node2}\n")
+            if k:
+                self.results_text.insert(tk.END, f"Showing the {k} poles nearest {system.frequency:.2f} Hz\n")
+            self.results_text.insert(tk.END, "Poles (natural frequency, damping ratio, Q):\n")
+            for f_n, zeta, q in resonances(poles):
+                kind = "resonance" if zeta < 1 else "real pole"
+                self.results_text.insert(tk.END, f"  {f_n:.4g} Hz  ζ={zeta:.4g}  Q={q:.4g}  ({kind})\n")
+            if not len(poles):
+                self.results_text.insert(tk.END, "  none (purely resistive network)\n")
+            self.results_text.insert(tk.END, "Zeros:\n")
+            for z in zeros:
+                self.results_text.insert(tk.END, f"  s = {z.real:.4g} {'+' if z.imag >= 0 else '-'} "
+                                                 f"j{abs(z.imag):.4g} rad/s ({abs(z) / (2 * np.pi):.4g} Hz)\n")
+            if not len(zeros):
+                self.results_text.insert(tk.END, "  none\n")
+        except np.linalg.LinAlgError:
+            self.results_text.insert(tk.END, "Matrix is singular - check your circuit connections\n")
+        except Exception as e:
+            self.results_text.insert(tk.END, f"\nError in analysis: {str(e)}\n")
+    
+    def plot_frequency_response(self):
+        """Bode and Nyquist plots of the selected output node, refined adaptively"""
+        output = self.sensitivity_node_var.get()
+        if not output:
+            messagebox.showerror("Error", "Please select an output node")
+            return
+        if not self.components and not self.voltage_sources and not self.current_sources:
+            messagebox.showerror("Error", "No components or sources to analyze")
+            return
+        f_min, f_max = self.response_f_min.get(), self.response_f_max.get()
+        if not 0 < f_min < f_max:
+            messagebox.showerror("Error", "Frequency range must satisfy 0 < From < To")
+            return
+        
+        floating = self.topology.connectivity.floating_islands()
+        if floating:
+            self.report_floating_islands(floating)
+            return
+        system = MNASystem(self.components, self.voltage_sources, self.current_sources, topology=self.topology)
+        if output not in system.node_index:
+            self.results_text.insert(tk.END, f"Node {output} is not connected to any element\n")
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"Frequency Response of V({output})")
+        figure = Figure(figsize=(7, 8), dpi=100)
+        magnitude_ax = figure.add_subplot(311)
+        phase_ax = figure.add_subplot(312, sharex=magnitude_ax)
+        nyquist_ax = figure.add_subplot(313)
+        figure.tight_layout()
+        canvas = FigureCanvasTkAgg(figure, master=window)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        plot = FrequencyPlot(magnitude_ax, phase_ax, nyquist_ax, canvas=canvas)
+        chunks = plot(adaptive_frequency_response(system, f_min, f_max, [output]))
+        
+        def step():
+            # One refinement pass per Tk callback keeps the window responsive while it draws
+            try:
+                next(chunks)
+            except StopIteration:
+                peak = np.nanargmax(np.abs(plot.values))
+                self.results_text.insert(tk.END, 
+                    f"\n=== Frequency Response of V({output}) ===\n"
+                    f"{len(plot.frequencies)} adaptive solves from {f_min:g} Hz to {f_max:g} Hz\n"
+                    f"Peak |V({output})| = {abs(plot.values[peak]):.4f}V at {plot.frequencies[peak]:.2f} Hz\n")
+                return
+            except Exception as e:
+                self.results_text.insert(tk.END, f"\nError in frequency response: {str(e)}\n")
+                return
+            window.after(1, step)
+        
+        step()
+    
     def detect_series_parallel(self):
         """Detect series and parallel connections in the circuit"""
         if not self.components:
@@ -827,20 +3831,12 @@ class EnhancedACCircuitAnalyzer:
             
         self.results_text.insert(tk.END, "\n=== Series/Parallel Analysis ===\n")
         
-        # Build adjacency list for components
-        component_graph = defaultdict(list)
-        for idx, (_, _, node1, node2) in enumerate(self.components):
-            component_graph[node1].append((node2, idx))
-            component_graph[node2].append((node1, idx))
+        # Nodes where exactly two passives meet, from the topology index
+        series = self.topology.series_candidates()
         
-        # Find all nodes with exactly two components connected (potential series connection points)
-        series_nodes = [node for node in component_graph if len(component_graph[node]) == 2 and node != "GND"]
-        
-        if series_nodes:
+        if series:
             self.results_text.insert(tk.END, "\nPotential Series Connections:\n")
-            for node in series_nodes:
-                comp1_idx = component_graph[node][0][1]
-                comp2_idx = component_graph[node][1][1]
+            for node, comp1_idx, comp2_idx in series:
                 c1_type, c1_val, n11, n12 = self.components[comp1_idx]
                 c2_type, c2_val, n21, n22 = self.components[comp2_idx]
                 
@@ -850,31 +3846,16 @@ class EnhancedACCircuitAnalyzer:
             self.results_text.insert(tk.END, "\nNo obvious series connections found\n")
         
         # Find parallel components (same node pairs)
-        parallel_groups = defaultdict(list)
-        for idx, (c_type, value, node1, node2) in enumerate(self.components):
-            key = tuple(sorted((node1, node2)))
-            parallel_groups[key].append((idx, c_type, value))
-        
-        parallel_exists = False
-        for nodes, components in parallel_groups.items():
-            if len(components) > 1:
-                if not parallel_exists:
-                    self.results_text.insert(tk.END, "\nParallel Components Found:\n")
-                    parallel_exists = True
-                
-                self.results_text.insert(tk.END, f"Between nodes {nodes[0]} and {nodes[1]}:\n")
-                for idx, c_type, value in components:
-                    display_value = value
-                    unit = "Ω"
-                    if c_type == "Capacitor":
-                        display_value = value * 1e6
-                        unit = "μF"
-                    elif c_type == "Inductor":
-                        display_value = value * 1e3
-                        unit = "mH"
-                    self.results_text.insert(tk.END, f"  - {c_type} {display_value:.2f}{unit}\n")
-        
-        if not parallel_exists:
+        parallel_groups = self.topology.parallel_groups()
+        if parallel_groups:
+            self.results_text.insert(tk.END, "\nParallel Components Found:\n")
+        for nodes, indices in parallel_groups:
+            self.results_text.insert(tk.END, f"Between nodes {nodes[0]} and {nodes[1]}:\n")
+            for idx in indices:
+                c_type, value = self.components[idx][:2]
+                self.results_text.insert(tk.END, f"  - {c_type} {get_device_type(c_type).format_value(value)}\n")
+        
+        if not parallel_groups:
             self.results_text.insert(tk.END, "\nNo parallel components found\n")
     
     def calculate_equivalent_impedances(self, freq):
@@ -884,98 +3865,66 @@ class EnhancedACCircuitAnalyzer:
             
         omega = 2 * np.pi * freq
         
-        # Group components by their node pairs
-        component_groups = defaultdict(list)
-        for c_type, value, node1, node2 in self.components:
-            key = tuple(sorted((node1, node2)))
-            component_groups[key].append((c_type, value))
-        
         # Check for parallel components
-        parallel_exists = False
-        for nodes, components in component_groups.items():
-            if len(components) > 1:
-                if not parallel_exists:
-                    self.results_text.insert(tk.END, "\n=== Equivalent Parallel Impedances ===\n")
-                    parallel_exists = True
-                
-                # Calculate parallel impedance
-                total_admittance = 0
-                for c_type, value in components:
-                    if c_type == "Resistor":
-                        z = value
-                    elif c_type == "Capacitor":
-                        z = 1 / (1j * omega * value)
-                    elif c_type == "Inductor":
-                        z = 1j * omega * value
-                    total_admittance += 1 / z
-                
-                z_eq = 1 / total_admittance
-                
-                self.results_text.insert(tk.END, 
-                    f"Between {nodes[0]} and {nodes[1]}: {len(components)} components in parallel\n")
-                self.results_text.insert(tk.END, 
-                    f"Equivalent impedance: {abs(z_eq):.4f}Ω ∠{np.degrees(cmath.phase(z_eq)):.2f}°\n")
-        
-        # Check for series components by finding chains
-        # This is more complex and would require graph traversal
-        # For now, we'll just look for two components sharing one node (simple series)
-        component_connections = defaultdict(list)
-        for idx, (_, _, node1, node2) in enumerate(self.components):
-            component_connections[node1].append(idx)
-            component_connections[node2].append(idx)
-        
-        series_exists = False
-        for node, indices in component_connections.items():
-            if len(indices) == 2 and node != "GND":
-                if not series_exists:
-                    self.results_text.insert(tk.END, "\n=== Equivalent Series Impedances ===\n")
-                    series_exists = True
-                
-                idx1, idx2 = indices
-                c1_type, c1_val, n11, n12 = self.components[idx1]
-                c2_type, c2_val, n21, n22 = self.components[idx2]
-                
-                # Calculate series impedance
-                z1 = 0
-                if c1_type == "Resistor":
-                    z1 = c1_val
-                elif c1_type == "Capacitor":
-                    z1 = 1 / (1j * omega * c1_val)
-                elif c1_type == "Inductor":
-                    z1 = 1j * omega * c1_val
-                
-                z2 = 0
-                if c2_type == "Resistor":
-                    z2 = c2_val
-                elif c2_type == "Capacitor":
-                    z2 = 1 / (1j * omega * c2_val)
-                elif c2_type == "Inductor":
-                    z2 = 1j * omega * c2_val
-                
-                z_eq = z1 + z2
-                
-                self.results_text.insert(tk.END, 
-                    f"Series connection at node {node}: {c1_type} and {c2_type}\n")
-                self.results_text.insert(tk.END, 
-                    f"Equivalent impedance: {abs(z_eq):.4f}Ω ∠{np.degrees(cmath.phase(z_eq)):.2f}°\n")
+        parallel_groups = self.topology.parallel_groups()
+        if parallel_groups:
+            self.results_text.insert(tk.END, "\n=== Equivalent Parallel Impedances ===\n")
+        for nodes, indices in parallel_groups:
+            # Calculate parallel impedance
+            total_admittance = 0
+            for idx in indices:
+                c_type, value = self.components[idx][:2]
+                total_admittance += 1 / get_device_type(c_type).impedance(value, omega)
+            
+            z_eq = 1 / total_admittance
+            
+            self.results_text.insert(tk.END, 
+                f"Between {nodes[0]} and {nodes[1]}: {len(indices)} components in parallel\n")
+            self.results_text.insert(tk.END, 
+                f"Equivalent impedance: {abs(z_eq):.4f}Ω ∠{np.degrees(cmath.phase(z_eq)):.2f}°\n")
+        
+        # Simple series: two passives sharing one node, from the topology index
+        series = self.topology.series_candidates()
+        if series:
+            self.results_text.insert(tk.END, "\n=== Equivalent Series Impedances ===\n")
+        for node, idx1, idx2 in series:
+            c1_type, c1_val, n11, n12 = self.components[idx1]
+            c2_type, c2_val, n21, n22 = self.components[idx2]
+            
+            # Calculate series impedance
+            z1 = get_device_type(c1_type).impedance(c1_val, omega)
+            z2 = get_device_type(c2_type).impedance(c2_val, omega)
+            z_eq = z1 + z2
+            
+            self.results_text.insert(tk.END, 
+                f"Series connection at node {node}: {c1_type} and {c2_type}\n")
+            self.results_text.insert(tk.END, 
+                f"Equivalent impedance: {abs(z_eq):.4f}Ω ∠{np.degrees(cmath.phase(z_eq)):.2f}°\n")
     
     def clear_circuit(self):
         self.components = []
         self.voltage_sources = []
         self.current_sources = []
         self.nodes = {"GND"}  # Keep only ground
+        self.node_order = ["GND"]
         self.next_node_id = 0
+        self.topology = TopologyIndex()
         
         # Update all displays
-        self.update_component_list()
-        self.update_source_list()
-        self.update_current_source_list()
-        self.update_node_menus()
-        self.update_node_list()
-        self.draw_circuit()
+        self.schedule_refresh("nodes", "components", "voltage_sources", "current_sources", "diagram")
         self.results_text.delete(1.0, tk.END)
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Enhanced AC Circuit Analyzer")
+    parser.add_argument("--serve", action="store_true", help="run the local analysis server instead of the GUI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="serve on this Unix socket path instead of TCP")
+    args = parser.parse_args()
+    if args.serve:
+        run_server(args.host, args.port, args.socket)
+        raise SystemExit
     root = tk.Tk()
     app = EnhancedACCircuitAnalyzer(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,759 @@
+import asyncio
+import csv
+import threading
+
+import numpy as np
+import pytest
+
+import linear_code as lc
+
+
+def random_netlist(rng, k):
+    n = int(rng.integers(3, 11))
+    nodes = [f"n{i}" for i in range(n)]
+    components = []
+    for i in range(n):
+        other = "GND" if i == 0 else nodes[int(rng.integers(0, i))]
+        kind = ("Resistor", "Capacitor", "Inductor")[int(rng.integers(0, 3))]
+        value = {"Resistor": rng.uniform(10, 1e3), "Capacitor": rng.uniform(1e-7, 1e-5),
+                 "Inductor": rng.uniform(1e-3, 1e-1)}[kind]
+        components.append((kind, value, nodes[i], other))
+        components.append(("Resistor", rng.uniform(1e2, 1e4), nodes[i], "GND"))
+    if k % 3 == 0:
+        components += [("VCVS", -2.0, "v", "GND", nodes[0], "GND"), ("Resistor", 1e3, "v", "GND")]
+    if k % 4 == 0:
+        components += [("Coupled Inductors", (1e-3, 2e-3, 0.5), nodes[1], "GND", "m", "GND"),
+                       ("Resistor", 50.0, "m", "GND")]
+    if k % 5 == 0:
+        # The sense branch is an ammeter in series with a resistor from nodes[2]
+        components += [("Resistor", 100.0, nodes[2], "s"), ("CCVS", 5.0, "o", "GND", "s", "GND"),
+                       ("Resistor", 1e3, "o", "GND")]
+    voltage_sources = [("Sine", rng.uniform(1, 10), rng.uniform(50, 1e4), rng.uniform(0, 90), nodes[0], "GND")]
+    if k % 2 == 0:
+        voltage_sources.append(("Sine", 1.0, 60.0, 0.0, nodes[-1], nodes[-2]))
+    current_sources = [("Sine", 0.01, 1000.0, 30.0, nodes[1], "GND")] if k % 3 == 1 else []
+    return components, voltage_sources, current_sources
+
+
+def reference(netlist, frequency=None):
+    system = lc.MNASystem(*netlist)
+    x = system.solve(2 * np.pi * (system.frequency if frequency is None else frequency))
+    voltages = system.node_voltages(x)
+    return voltages, system.source_currents(x)
+
+
+def assert_matches(netlist, solution, frequency=None):
+    voltages, currents = reference(netlist, frequency)
+    got = solution.node_voltages()
+    for node, value in voltages.items():
+        assert got[node] == pytest.approx(complex(value), rel=1e-9, abs=1e-12)
+    np.testing.assert_allclose(solution.source_currents, currents, rtol=1e-9, atol=1e-12)
+
+
+def test_solve_batch_matches_mna_system():
+    rng = np.random.default_rng(7)
+    netlists = [random_netlist(rng, k) for k in range(60)]
+    solutions, info = lc.solve_batch(netlists)
+    assert info["circuits"] == 60 and sum(info["groups"].values()) == 60
+    for netlist, solution in zip(netlists, solutions):
+        assert not solution.singular
+        assert_matches(netlist, solution)
+
+
+def test_solve_batch_all_coupled_inductors():
+    netlists = [([("Coupled Inductors", (1e-3, 2e-3, k), "a", "GND", "b", "GND"), ("Resistor", 50.0, "b", "GND")],
+                 [("Sine", 1.0, 1000.0, 0.0, "a", "GND")], []) for k in (0.1, 0.3, 0.9)]
+    solutions, _ = lc.solve_batch(netlists)
+    for netlist, solution in zip(netlists, solutions):
+        assert_matches(netlist, solution)
+    only_coupled = ([("Coupled Inductors", (1e-3, 2e-3, 0.3), "a", "GND", "b", "GND")],
+                    [("Sine", 1.0, 1000.0, 0.0, "a", "GND")], [])
+    solutions, _ = lc.solve_batch([only_coupled])
+    assert_matches(only_coupled, solutions[0])
+
+
+def test_solve_batch_singular_circuit_does_not_poison_group():
+    good = ([("Resistor", 100.0, "a", "GND")], [("Sine", 1.0, 60.0, 0.0, "a", "GND")], [])
+    # Two different voltage sources across the same node pair
+    bad = ([("Resistor", 100.0, "a", "GND")],
+           [("Sine", 1.0, 60.0, 0.0, "a", "GND"), ("Sine", 2.0, 60.0, 0.0, "a", "GND")], [])
+    solutions, _ = lc.solve_batch([good, bad, good])
+    assert [solution.singular for solution in solutions] == [False, True, False]
+    assert_matches(good, solutions[2])
+
+
+def test_solve_batch_empty_inputs():
+    solutions, info = lc.solve_batch([])
+    assert solutions == [] and info["circuits"] == 0
+    solutions, _ = lc.solve_batch([([], [], [])])
+    assert solutions[0].voltages.size == 0 and not solutions[0].singular
+
+
+def test_solve_batch_explicit_zero_frequency():
+    netlist = ([("Resistor", 10.0, "a", "b"), ("Capacitor", 1e-6, "b", "GND"), ("Resistor", 1e3, "b", "GND")],
+               [("Sine", 1.0, 1177.5, 0.0, "a", "GND")], [])
+    solutions, _ = lc.solve_batch([netlist], frequency=0.0)
+    assert solutions[0].frequency == 0.0
+    assert_matches(netlist, solutions[0], frequency=0.0)
+
+
+def test_solve_batch_indexed_matches_named_path():
+    rng = np.random.default_rng(3)
+    netlists = [random_netlist(rng, k) for k in range(1, 40, 2)]  # no coupled inductors: k is odd
+    solutions, _ = lc.solve_batch(netlists, frequency=500.0)
+
+    kinds, values, terminals, counts, num_nodes = [], [], [], [], []
+    v_terminals, v_phasors, v_counts, i_terminals, i_phasors, i_counts = [], [], [], [], [], []
+    for (components, voltage_sources, current_sources), solution in zip(netlists, solutions):
+        ids = {name: k for k, name in enumerate(solution.node_names)}
+        ids["GND"] = -1
+        for component in components:
+            kinds.append(component[0])
+            values.append(component[1])
+            terminals.append([ids[node] for node in component[2:]] + [-1] * (6 - len(component)))
+        counts.append(len(components))
+        num_nodes.append(len(ids) - 1)
+        for sources, terminal_list, phasors, source_counts in ((voltage_sources, v_terminals, v_phasors, v_counts),
+                                                               (current_sources, i_terminals, i_phasors, i_counts)):
+            for _, peak, _, phase, plus, minus in sources:
+                terminal_list.append((ids[plus], ids[minus]))
+                phasors.append(peak * np.exp(1j * np.radians(phase)))
+            source_counts.append(len(sources))
+
+    voltages, currents, info = lc.solve_batch_indexed(
+        kinds, values, terminals, counts, num_nodes, 500.0,
+        v_terminals, v_phasors, v_counts, i_terminals, i_phasors, i_counts)
+    assert info["circuits"] == len(netlists)
+    for k, solution in enumerate(solutions):
+        np.testing.assert_allclose(voltages[k, :num_nodes[k]], solution.voltages, rtol=1e-12)
+        assert np.isnan(voltages[k, num_nodes[k]:]).all()
+        np.testing.assert_allclose(currents[k, :v_counts[k]], solution.source_currents, rtol=1e-12)
+
+
+@pytest.fixture
+def served_circuit():
+    server, ready = lc.AnalysisServer(), threading.Event()
+
+    def run():
+        async def main():
+            await server.start()
+            ready.set()
+            await server.serve_forever()
+        asyncio.run(main())
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    client = lc.AnalysisClient(server.address, timeout=10.0)
+    circuit = client.load([("Resistor", 100.0, "1", "2"), ("Capacitor", 1e-6, "2", "GND")],
+                          [("AC", 10.0, 1000.0, 0.0, "1", "GND")])
+    yield server, client, circuit
+    client.close()
+
+
+def test_server_rejects_unknown_nodes(served_circuit):
+    _, client, circuit = served_circuit
+    with pytest.raises(RuntimeError, match="Unknown node 'CC'"):
+        client.solve(circuit, [1e3], outputs=["CC"])
+    with pytest.raises(RuntimeError, match="Unknown node 'X'"):
+        client.impedance(circuit, ("X", "Y"), [1e3])
+    assert client.solve(circuit, [1e3], outputs=["2"]).shape == (1, 1)
+
+
+def test_server_answers_batch_when_solver_fails(served_circuit, monkeypatch):
+    server, client, circuit = served_circuit
+
+    def fail(*args):
+        raise RuntimeError("solver crashed")
+
+    monkeypatch.setattr(server, "_solve_batch", fail)
+    with pytest.raises(RuntimeError, match="solver crashed"):
+        client.solve(circuit, [1e3])
+    monkeypatch.undo()
+    assert client.solve(circuit, [1e3], outputs=["2"]).shape == (1, 1)
+
+
+class PickerStub(dict):
+    """Just enough of a NodePicker to call its filter without a display"""
+
+    def __init__(self, typed, nodes):
+        super().__init__()
+        self.variable = type("Var", (), {"get": lambda self: typed})()
+        self.nodes = lambda: nodes
+        self.exclude = set()
+        self.limit = 50
+
+
+@pytest.mark.parametrize("typed, expected", [("N999", ["N999"]), ("", None), ("zzz", None)])
+def test_node_picker_filter(typed, expected):
+    nodes = [f"N{k}" for k in range(1000)]
+    picker = PickerStub(typed, nodes)
+    lc.NodePicker.filter(picker)
+    assert picker["values"] == (expected or nodes[:50])
+
+
+def test_mixed_precision_matches_double_on_badly_scaled_columns():
+    rng = np.random.default_rng(0)
+    n = 300
+    A = rng.normal(size=(n, n)) + 1j * rng.normal(size=(n, n)) + n * np.eye(n)
+    A[:, 0] *= 1e6
+    b = rng.normal(size=n) + 0j
+    x, info = lc.solve_mixed_precision(A, b)
+    expected = np.linalg.solve(A, b)
+    assert info["precision"] == "mixed"
+    assert np.abs(x - expected).max() <= 1e-13 * np.abs(expected).max()
+    assert info["backward_error"] == pytest.approx(lc.backward_error(A, x, b))
+
+
+def test_sweep_grid_refuses_to_resume_a_different_sweep(tmp_path):
+    system = lc.MNASystem([("Resistor", 1000.0, "N1", "N2"), ("Capacitor", 1e-6, "N2", "GND")],
+                          [("Sine", 10.0, 60.0, 0.0, "N1", "GND")])
+    axes = [lc.SweepAxis("R", ("component", 0), [100.0, 1000.0]), lc.SweepAxis("f", "frequency", [50.0, 60.0])]
+    first = np.array(lc.sweep_grid(system, axes, tmp_path, outputs=["N2"], workers=1))
+    # Same shapes, so only the fingerprint tells these apart
+    changed = [axes[0], lc.SweepAxis("f", "frequency", [70.0, 80.0])]
+    with pytest.raises(ValueError, match="different"):
+        lc.sweep_grid(system, changed, tmp_path, outputs=["N2"], workers=1)
+    with pytest.raises(ValueError, match="different"):
+        lc.sweep_grid(system, axes, tmp_path, outputs=["N1"], workers=1)
+    again = lc.sweep_grid(system, axes, tmp_path, outputs=["N2"], workers=1)
+    np.testing.assert_array_equal(again, first)
+
+
+@pytest.mark.skipif(lc.spla is None, reason="IterativeSolver requires SciPy")
+def test_iterative_solver_reports_jacobi_fallback(monkeypatch):
+    n = 50
+    A = lc.sp.diags([-np.ones(n - 1), 4 * np.ones(n), -np.ones(n - 1)], [-1, 0, 1]).astype(complex)
+    b = np.ones(n, dtype=complex)
+    solver = lc.IterativeSolver(direct_limit=0)
+    solver.solve(A, b)
+    assert solver.info["preconditioner"] == "ilu"
+
+    def singular(*args, **kwargs):
+        raise RuntimeError("Factor is exactly singular")
+
+    monkeypatch.setattr(lc.spla, "spilu", singular)
+    x = solver.solve(A, b)
+    assert solver.info["preconditioner"] == "jacobi" and solver.info["converged"]
+    np.testing.assert_allclose(A @ x, b, atol=1e-8)
+
+
+def test_series_candidates_skip_nodes_with_other_elements():
+    resistors = [("Resistor", 100.0, "A", "B"), ("Resistor", 200.0, "B", "GND")]
+    topology = lc.TopologyIndex.from_netlist(resistors)
+    assert topology.series_candidates() == [("B", 0, 1)]
+    topology.add_component(("VCVS", 2.0, "B", "GND", "A", "GND"))
+    assert topology.series_candidates() == []
+    topology = lc.TopologyIndex.from_netlist(resistors, [("Sine", 1.0, 60.0, 0.0, "B", "GND")])
+    assert topology.series_candidates() == []
+
+
+def rc_grid(size, kind="Capacitor", value=1e-6):
+    """size x size resistor grid with kind to ground at every node, driven by one voltage source"""
+    name = "n{}_{}".format
+    components = []
+    for i in range(size):
+        for j in range(size):
+            if i + 1 < size:
+                components.append(("Resistor", 1.0, name(i, j), name(i + 1, j)))
+            if j + 1 < size:
+                components.append(("Resistor", 1.0, name(i, j), name(i, j + 1)))
+            components.append((kind, value, name(i, j), "GND"))
+    return lc.MNASystem(components, [("Sine", 1.0, 1000.0, 0.0, name(0, 0), "GND")])
+
+
+@pytest.mark.skipif(lc.spla is None, reason="IterativeSolver requires SciPy")
+@pytest.mark.parametrize("method", ["gmres", "bicgstab"])
+@pytest.mark.parametrize("preconditioner", ["ilu", "jacobi", None])
+def test_iterative_solver_on_voltage_source_driven_mna(method, preconditioner):
+    system = rc_grid(20)
+    omega = 2 * np.pi * 1000
+    expected = system.solve(omega)
+    solver = lc.IterativeSolver(method, preconditioner, direct_limit=0)
+    x = system.solve(omega, solver=solver)
+    assert solver.info["converged"] and solver.info["residual"] < 1e-9
+    np.testing.assert_allclose(x, expected, atol=1e-8 * np.abs(expected).max())
+
+
+@pytest.mark.skipif(lc.spla is None, reason="IterativeSolver requires SciPy")
+def test_iterative_solver_raises_when_not_converged():
+    system = rc_grid(20)
+    solver = lc.IterativeSolver("gmres", None, max_iter=10, direct_limit=0)
+    with pytest.raises(np.linalg.LinAlgError):
+        system.solve(2 * np.pi * 1000, solver=solver)
+    assert not solver.info["converged"] and solver.info["iterations"] <= 10 + 49
+
+
+def every_device_netlist():
+    """One instance of every device type, all sources and a nonsingular MNA matrix"""
+    components = [
+        ("Resistor", 100.0, "a", "b"), ("Capacitor", 2e-6, "b", "GND"), ("Inductor", 5e-3, "b", "c"),
+        ("Resistor", 220.0, "c", "GND"),
+        ("VCVS", -2.0, "d", "GND", "b", "GND"), ("Resistor", 1e3, "d", "e"), ("Resistor", 470.0, "e", "GND"),
+        ("VCCS", 0.01, "f", "GND", "c", "GND"), ("Resistor", 330.0, "f", "GND"),
+        ("Resistor", 150.0, "e", "s"), ("CCCS", 3.0, "g", "GND", "s", "GND"), ("Resistor", 680.0, "g", "GND"),
+        ("Resistor", 270.0, "f", "t"), ("CCVS", 50.0, "h", "GND", "t", "GND"), ("Resistor", 820.0, "h", "GND"),
+        ("Coupled Inductors", (1e-3, 4e-3, 0.6), "c", "GND", "m", "GND"), ("Resistor", 75.0, "m", "GND"),
+    ]
+    voltage_sources = [("Sine", 5.0, 1000.0, 30.0, "a", "GND")]
+    current_sources = [("Sine", 0.02, 1000.0, -45.0, "GND", "g")]
+    return components, voltage_sources, current_sources
+
+
+def with_parameter(system, netlist, p, value):
+    """netlist with parameter p (ordered as in system.parameters()) set to value"""
+    components, voltage_sources, current_sources = (list(part) for part in netlist)
+    targets = [(index, col) for group in system.groups for col in range(group.device.params)
+               for index in group.indices]
+    if p < len(targets):
+        index, col = targets[p]
+        component = list(components[index])
+        if isinstance(component[1], tuple):
+            params = list(component[1])
+            params[col] = value
+            component[1] = tuple(params)
+        else:
+            component[1] = value
+        components[index] = tuple(component)
+    else:
+        p -= len(targets)
+        sources = voltage_sources if p < len(voltage_sources) else current_sources
+        p = p if p < len(voltage_sources) else p - len(voltage_sources)
+        sources[p] = sources[p][:1] + (value,) + sources[p][2:]
+    return components, voltage_sources, current_sources
+
+
+def test_sensitivities_match_central_differences():
+    netlist = every_device_netlist()
+    system = lc.MNASystem(*netlist)
+    outputs = ["b", ("e", "g"), "m"]
+    omegas = 2 * np.pi * np.array([200.0, 1000.0, 5000.0])
+    v_out, sens = system.sensitivities(omegas, outputs)
+    _, values = system.parameters()
+    assert sens.shape == (len(omegas), len(outputs), len(values))
+
+    for p, value in enumerate(values):
+        step = 1e-6 * abs(value)
+        plus = lc.MNASystem(*with_parameter(system, netlist, p, value + step))
+        minus = lc.MNASystem(*with_parameter(system, netlist, p, value - step))
+        selector = system.output_selectors(outputs)
+        numeric = (plus.solve(omegas) @ selector - minus.solve(omegas) @ selector) / (2 * step)
+        np.testing.assert_allclose(sens[..., p], numeric, rtol=1e-6, atol=1e-9 * np.abs(v_out).max() / abs(value))
+
+
+R_SERIES, L_SERIES, C_SERIES = 10.0, 1e-3, 1e-6
+
+
+def series_rlc():
+    return lc.MNASystem([("Resistor", R_SERIES, "a", "b"), ("Inductor", L_SERIES, "b", "c"),
+                         ("Capacitor", C_SERIES, "c", "GND")],
+                        [("Sine", 1.0, 1000.0, 0.0, "a", "GND")])
+
+
+def assert_same_roots(got, expected, rtol=1e-8):
+    got, expected = list(np.asarray(got)), np.asarray(expected)
+    assert len(got) == len(expected)
+    for root in expected:
+        nearest = min(got, key=lambda value: abs(value - root))
+        assert abs(nearest - root) <= rtol * abs(root)
+        got.remove(nearest)
+
+
+@pytest.mark.parametrize("scipy", [True, False])
+def test_series_rlc_poles_zeros_and_q(scipy, monkeypatch):
+    if not scipy:
+        monkeypatch.setattr(lc, "sla", None)
+    elif lc.sla is None:
+        pytest.skip("needs SciPy")
+    system = series_rlc()
+    poles = system.poles()
+    assert_same_roots(poles, np.roots([L_SERIES * C_SERIES, R_SERIES * C_SERIES, 1.0]))
+    zeros = system.zeros(("V", 0), "b")
+    w0 = 1 / np.sqrt(L_SERIES * C_SERIES)
+    assert_same_roots(zeros, [1j * w0, -1j * w0])
+    assert len(system.zeros(("V", 0), "c")) == 0  # the capacitor voltage is all-pole
+
+    (frequency, zeta, q), = lc.resonances(poles)
+    assert frequency == pytest.approx(w0 / (2 * np.pi))
+    assert q == pytest.approx(np.sqrt(L_SERIES / C_SERIES) / R_SERIES)
+    assert zeta == pytest.approx(1 / (2 * q))
+
+
+@pytest.mark.skipif(lc.sp is None, reason="the sparse eigensolver needs SciPy")
+def test_sparse_poles_match_dense_above_dense_limit():
+    nodes = [f"n{k}" for k in range(520)]
+    components = [("Resistor", 10.0, "in", nodes[0])]
+    for k, node in enumerate(nodes):
+        components.append(("Capacitor", 1e-6 * (1 + k % 3), node, "GND"))
+        if k + 1 < len(nodes):
+            components.append(("Resistor", 10.0, node, nodes[k + 1]))
+    system = lc.MNASystem(components, [("Sine", 1.0, 1000.0, 0.0, "in", "GND")])
+    assert system.size > 500
+
+    sparse = system.poles(k=6, target=-100.0)
+    dense = system.poles(k=6, target=-100.0, dense_limit=10 ** 6)
+    assert_same_roots(sparse, dense, rtol=1e-6)
+
+
+DRIVEN = [("Resistor", 100.0, "a", "GND")], [("Sine", 1.0, 1000.0, 0.0, "a", "GND")]
+
+
+def test_floating_pair_is_named():
+    components, sources = DRIVEN
+    components = components + [("Resistor", 50.0, "x", "y"), ("Capacitor", 1e-6, "y", "x")]
+    with pytest.raises(lc.FloatingNodeError) as raised:
+        lc.solve_decomposed(components, sources, [], 2 * np.pi * 1000)
+    assert raised.value.islands == [["x", "y"]]
+    assert "x, y" in str(raised.value)
+
+
+def test_vccs_output_without_path_to_ground_is_floating():
+    components, sources = DRIVEN
+    # The VCCS output is an ideal current source: it couples "o" to the
+    # circuit but gives it no impedance to GND
+    components = components + [("VCCS", 0.01, "o", "GND", "a", "GND")]
+    connectivity = lc.CircuitConnectivity.from_netlist(components, sources)
+    assert connectivity.island_of("o") == connectivity.island_of("a")
+    with pytest.raises(lc.FloatingNodeError) as raised:
+        lc.solve_decomposed(components, sources, [], 2 * np.pi * 1000, connectivity=connectivity)
+    assert raised.value.islands == [["o"]]
+
+    components.append(("Resistor", 1e3, "o", "GND"))
+    voltages, _, _ = lc.solve_decomposed(components, sources, [], 2 * np.pi * 1000)
+    assert voltages["o"] == pytest.approx(-0.01 * 1e3 * voltages["a"])
+
+
+def two_islands():
+    components = [("Resistor", 100.0, "a", "GND"), ("Capacitor", 1e-6, "a", "b"),
+                  ("Resistor", 220.0, "b", "GND"),
+                  ("Resistor", 470.0, "c", "GND"), ("Inductor", 1e-3, "c", "d"),
+                  ("Resistor", 68.0, "d", "GND")]
+    voltage_sources = [("Sine", 1.0, 1000.0, 0.0, "a", "GND"), ("Sine", 2.0, 1000.0, 45.0, "d", "GND")]
+    current_sources = [("Sine", 0.01, 1000.0, 30.0, "b", "c"), ("Sine", 0.02, 1000.0, 0.0, "GND", "c")]
+    return components, voltage_sources, current_sources
+
+
+def test_current_source_across_islands_is_split():
+    components, voltage_sources, current_sources = two_islands()
+    connectivity = lc.CircuitConnectivity.from_netlist(components, voltage_sources, current_sources)
+    assert len(connectivity.islands()) == 2
+    parts = lc.split_netlist(components, voltage_sources, current_sources, connectivity)
+    assert sorted((comp, vs) for comp, vs, _ in parts) == [([0, 1, 2], [0]), ([3, 4, 5], [1])]
+    injected = {tuple(comp): cs for comp, _, cs in parts}
+    assert injected[(0, 1, 2)] == [("Sine", 0.01, 1000.0, 30.0, "b", "GND")]
+    assert injected[(3, 4, 5)] == [("Sine", 0.01, 1000.0, 30.0, "GND", "c"),
+                                   ("Sine", 0.02, 1000.0, 0.0, "GND", "c")]
+
+
+@pytest.mark.parametrize("workers", [None, 4])
+def test_decomposed_solve_matches_single_system(workers):
+    components, voltage_sources, current_sources = two_islands()
+    omega = 2 * np.pi * 1000
+    whole = lc.MNASystem(components, voltage_sources, current_sources)
+    x = whole.solve(omega)
+    voltages, component_currents, source_currents = lc.solve_decomposed(
+        components, voltage_sources, current_sources, omega, workers=workers)
+    expected = whole.node_voltages(x)
+    assert voltages.keys() == expected.keys() | {"GND"}
+    for node, value in expected.items():
+        assert voltages[node] == pytest.approx(value, rel=1e-12, abs=1e-15)
+    np.testing.assert_allclose(component_currents, whole.component_currents(x, omega), rtol=1e-12)
+    np.testing.assert_allclose(source_currents, whole.source_currents(x), rtol=1e-12)
+
+
+def expected_ports(voltages, omega):
+    """Hand-derived (voltage, current) of every port of every_device_netlist()
+
+    Keyed by (kind, owner, port); currents flow from a to b through the element.
+    """
+    v = voltages
+    w = 1j * omega
+    sense_s = (v["e"] - v["s"]) / 150.0
+    sense_t = (v["f"] - v["t"]) / 270.0
+    l1, l2, k = 1e-3, 4e-3, 0.6
+    i2 = -v["m"] / 75.0
+    i1 = (v["c"] / w - k * np.sqrt(l1 * l2) * i2) / l1
+    source = 0.02 * np.exp(1j * np.radians(-45.0))
+    ports = {
+        ("component", 0, 0): (v["a"] - v["b"], (v["a"] - v["b"]) / 100.0),
+        ("component", 1, 0): (v["b"], w * 2e-6 * v["b"]),
+        ("component", 2, 0): (v["b"] - v["c"], (v["b"] - v["c"]) / (w * 5e-3)),
+        ("component", 4, 0): (v["d"], -(v["d"] - v["e"]) / 1e3),  # KCL at d
+        ("component", 7, 0): (v["f"], 0.01 * v["c"]),
+        ("component", 10, 0): (v["g"], 3.0 * sense_s),
+        ("component", 10, 1): (v["s"], sense_s),
+        ("component", 13, 0): (v["h"], -v["h"] / 820.0),  # KCL at h
+        ("component", 13, 1): (v["t"], sense_t),
+        ("component", 15, 0): (v["c"], i1),
+        ("component", 15, 1): (v["m"], i2),
+        ("voltage source", 0, 0): (v["a"], -(v["a"] - v["b"]) / 100.0),
+        ("current source", 0, 0): (-v["g"], source),
+    }
+    for index, (a, b, r) in {3: ("c", "GND", 220.0), 5: ("d", "e", 1e3), 6: ("e", "GND", 470.0),
+                             8: ("f", "GND", 330.0), 9: ("e", "s", 150.0), 11: ("g", "GND", 680.0),
+                             12: ("f", "t", 270.0), 14: ("h", "GND", 820.0), 16: ("m", "GND", 75.0)}.items():
+        ports[("component", index, 0)] = (v[a] - v[b], (v[a] - v[b]) / r)
+    return ports
+
+
+@pytest.mark.parametrize("device", ["Resistor", "Capacitor", "Inductor", "VCVS", "VCCS", "CCCS", "CCVS",
+                                    "Coupled Inductors", "voltage source", "current source"])
+def test_branch_results_match_hand_derived_ports(device):
+    components, voltage_sources, current_sources = every_device_netlist()
+    system = lc.MNASystem(components, voltage_sources, current_sources)
+    omega = 2 * np.pi * 1000
+    x = system.solve(omega)
+    results = system.branch_results(x, omega)
+    expected = expected_ports(system.node_voltages(x), omega)
+    assert len(results) == len(expected)
+
+    checked = 0
+    for entry in range(len(results)):
+        kind = lc.BranchResults.KINDS[results.kind[entry]]
+        owner, port = int(results.owner[entry]), int(results.port[entry])
+        if (components[owner][0] if kind == "component" else kind) != device:
+            continue
+        voltage, current = expected[(kind, owner, port)]
+        assert results.voltage[entry] == pytest.approx(voltage, rel=1e-9, abs=1e-12)
+        assert results.current[entry] == pytest.approx(current, rel=1e-9, abs=1e-12)
+        assert results.power[entry] == pytest.approx(voltage * np.conj(current) / 2, rel=1e-9, abs=1e-15)
+        checked += 1
+    assert checked
+
+    net, residual = results.balance()
+    assert residual < 1e-12
+    assert abs(net) < 1e-12 * np.abs(results.power).sum()
+
+
+def test_decomposed_branches_match_single_system():
+    components, voltage_sources, current_sources = two_islands()
+    omegas = 2 * np.pi * np.array([50.0, 1e3, 2e4])
+    whole = lc.MNASystem(components, voltage_sources, current_sources)
+    x = whole.solve(omegas)
+    expected = whole.branch_results(x, omegas)
+    _, residual = expected.balance()
+    assert residual.shape == (3,) and np.all(residual < 1e-12)
+
+    branches = []
+    _, component_currents, _ = lc.solve_decomposed(components, voltage_sources, current_sources,
+                                                    2 * np.pi * 1e3, branches=branches)
+    results, = branches
+    np.testing.assert_array_equal(results.kind, expected.kind)
+    np.testing.assert_array_equal(results.owner, expected.owner)
+    np.testing.assert_allclose(results.voltage, expected.voltage[1], rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(results.current, expected.current[1], rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(component_currents, whole.component_currents(x[1], omegas[1]), rtol=1e-12)
+
+
+W_STAMP = 2 * np.pi * 500.0
+L1, L2, K = 2e-3, 8e-3, 0.5
+JWM = 1j * W_STAMP * K * np.sqrt(L1 * L2)
+
+# Hand-derived MNA matrices of each element alone, terminals (a, b, c, d);
+# rows are V(a..d), then the element's branch currents
+HAND_STAMPS = {
+    ("VCVS", 3.0): [[0, 0, 0, 0, 1],
+                    [0, 0, 0, 0, -1],
+                    [0, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 0],
+                    [1, -1, -3, 3, 0]],
+    ("VCCS", 0.2): [[0, 0, 0.2, -0.2],
+                    [0, 0, -0.2, 0.2],
+                    [0, 0, 0, 0],
+                    [0, 0, 0, 0]],
+    ("CCCS", 4.0): [[0, 0, 0, 0, 4],
+                    [0, 0, 0, 0, -4],
+                    [0, 0, 0, 0, 1],
+                    [0, 0, 0, 0, -1],
+                    [0, 0, 1, -1, 0]],
+    ("CCVS", 50.0): [[0, 0, 0, 0, 0, 1],
+                     [0, 0, 0, 0, 0, -1],
+                     [0, 0, 0, 0, 1, 0],
+                     [0, 0, 0, 0, -1, 0],
+                     [0, 0, 1, -1, 0, 0],
+                     [1, -1, 0, 0, -50, 0]],
+    ("Coupled Inductors", (L1, L2, K)): [[0, 0, 0, 0, 1, 0],
+                                         [0, 0, 0, 0, -1, 0],
+                                         [0, 0, 0, 0, 0, 1],
+                                         [0, 0, 0, 0, 0, -1],
+                                         [1, -1, 0, 0, -1j * W_STAMP * L1, -JWM],
+                                         [0, 0, 1, -1, -JWM, -1j * W_STAMP * L2]],
+}
+
+
+@pytest.mark.parametrize("device, value", list(HAND_STAMPS))
+def test_stamps_match_hand_derived_mna(device, value):
+    expected = np.array(HAND_STAMPS[device, value], dtype=complex)
+    system = lc.MNASystem([(device, value, "a", "b", "c", "d")])
+    assert system.node_names == ["a", "b", "c", "d"]
+    np.testing.assert_allclose(system.assemble(W_STAMP), expected, rtol=1e-15, atol=0)
+    # Grounding a terminal drops its row and column; batched omegas stack
+    grounded = lc.MNASystem([(device, value, "a", "GND", "c", "d")])
+    keep = [0, 2, 3] + list(range(4, len(expected)))
+    stacked = grounded.assemble(np.array([W_STAMP, W_STAMP]))
+    np.testing.assert_allclose(stacked, np.broadcast_to(expected[np.ix_(keep, keep)], stacked.shape),
+                               rtol=1e-15, atol=0)
+
+
+def adaptive_samples(system, f_min, f_max, outputs):
+    chunks = list(lc.adaptive_frequency_response(system, f_min, f_max, outputs))
+    frequencies = np.concatenate([chunk.parameters["frequency"] for chunk in chunks])
+    values = np.concatenate([chunk.values for chunk in chunks])
+    order = np.argsort(frequencies)
+    return frequencies[order], values[order]
+
+
+@pytest.mark.parametrize("arms", [(("Resistor", 1e3), ("Resistor", 2.2e3), ("Resistor", 4.7e3), ("Resistor", 10.34e3)),
+                                  (("Resistor", 1e3), ("Capacitor", 1e-6), ("Resistor", 2.2e3),
+                                   ("Capacitor", 1e-6 / 2.2))])
+def test_adaptive_sweep_of_balanced_bridge_stays_coarse(arms):
+    (t1, v1), (t2, v2), (t3, v3), (t4, v4) = arms
+    system = lc.MNASystem([(t1, v1, "a", "b"), (t2, v2, "b", "GND"), (t3, v3, "a", "c"), (t4, v4, "c", "GND")],
+                          [("Sine", 1.0, 1000.0, 0.0, "a", "GND")])
+    # 4 decades at 5 points per decade, then one pass of 20 midpoints
+    frequencies, values = adaptive_samples(system, 10.0, 1e5, [("b", "c")])
+    assert len(frequencies) == 41
+    assert np.abs(values).max() < 1e-12
+    if t2 == t4 == "Resistor":
+        # Flat nonzero outputs next to the zero one need no refinement either
+        frequencies, _ = adaptive_samples(system, 10.0, 1e5, [("b", "c"), "b", "c"])
+        assert len(frequencies) == 41
+
+
+def test_adaptive_sweep_tracks_high_q_resonance():
+    # Series RLC with f0 ≈ 1.59 kHz and Q = sqrt(L/C)/R = 100
+    system = lc.MNASystem([("Resistor", 1.0, "a", "b"), ("Inductor", 10e-3, "b", "c"),
+                           ("Capacitor", 1e-6, "c", "GND")], [("Sine", 1.0, 1000.0, 0.0, "a", "GND")])
+    frequencies, values = adaptive_samples(system, 10.0, 1e5, ["c"])
+    assert len(frequencies) < 200
+    dense = np.logspace(1, 5, 20001)
+    exact, _ = lc._solve_outputs(system, dense, system.output_selectors(["c"]))
+    # dB interpolated linearly in log f, as the refinement assumes
+    interpolated = np.interp(np.log10(dense), np.log10(frequencies), 20 * np.log10(np.abs(values[:, 0])))
+    assert np.abs(interpolated - 20 * np.log10(np.abs(exact[:, 0]))).max() < 0.03
+
+
+def assert_same_solution(got, expected):
+    voltages, component_currents, source_currents = got
+    assert voltages.keys() == expected[0].keys()
+    for node, value in expected[0].items():
+        assert voltages[node] == pytest.approx(value, rel=1e-12, abs=1e-15)
+    np.testing.assert_allclose(component_currents, expected[1], rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(source_currents, expected[2], rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize("workers", [None, 4])
+def test_topology_islands_solve_without_rescanning(workers, monkeypatch):
+    netlist = two_islands()
+    omega = 2 * np.pi * 1000
+    expected = lc.solve_decomposed(*netlist, omega)
+    topology = lc.TopologyIndex.from_netlist(*netlist)
+    assert len(topology.islands) == 2
+    assert sorted(sorted(island.by_type["Resistor"]) for island in topology.islands.values()) == [[0, 2], [3, 5]]
+
+    def rescan(*args):
+        raise AssertionError("split_netlist called with a topology")
+    monkeypatch.setattr(lc, "split_netlist", rescan)
+    branches = []
+    got = lc.solve_decomposed(*netlist, omega, workers=workers, topology=topology, branches=branches)
+    assert_same_solution(got, expected)
+    _, residual = branches[0].balance()
+    assert residual < 1e-12
+
+
+def test_topology_islands_merge_as_elements_arrive():
+    topology = lc.TopologyIndex()
+    components = [("Resistor", 100.0, "x", "GND"), ("Capacitor", 1e-6, "y", "GND")]
+    voltage_sources = [("Sine", 1.0, 1000.0, 0.0, "v", "GND")]
+    current_sources = [("Sine", 0.01, 1000.0, 0.0, "x", "y"), ("Sine", 0.02, 1000.0, 0.0, "z", "GND")]
+    for component in components:
+        topology.add_component(component)
+    topology.add_voltage_source(voltage_sources[0])
+    for source in current_sources:
+        topology.add_current_source(source)
+    assert len(topology.islands) == 4
+    # Join x, y, z and v one element at a time; the split source recombines
+    for component in [("Resistor", 220.0, "x", "y"), ("Inductor", 1e-3, "z", "y"),
+                      ("VCVS", 2.0, "z", "GND", "v", "GND")]:
+        components.append(component)
+        topology.add_component(component)
+    island, = topology.islands.values()
+    assert sorted(topology.names[node_id] for node_id in island.nodes) == ["v", "x", "y", "z"]
+    assert sorted(island.current_sources, key=str) == [(0, 0), (0, 1), (1, None)]
+    assert island.voltage_sources == [0]
+
+    omega = 2 * np.pi * 1000
+    expected = lc.solve_decomposed(components, voltage_sources, current_sources, omega)
+    part, = topology.island_netlists(current_sources)
+    system = lc.MNASystem([components[i] for i in part[0]], voltage_sources, part[2],
+                          topology=topology, island=island)
+    assert system.node_names == ["x", "y", "v", "z"]  # node ID order
+    voltages = system.node_voltages(system.solve(omega))
+    for node, value in expected[0].items():
+        assert voltages[node] == pytest.approx(value, rel=1e-12, abs=1e-15)
+    assert_same_solution(lc.solve_decomposed(components, voltage_sources, current_sources, omega,
+                                             topology=topology), expected)
+
+
+def test_stream_frequency_response_chunks_cover_every_frequency():
+    system = series_rlc()
+    frequencies = np.logspace(1, 5, 10)
+    chunks = list(lc.stream_frequency_response(system, frequencies, ["b", ("b", "c")], chunk_size=4))
+    assert [(chunk.start, len(chunk)) for chunk in chunks] == [(0, 4), (4, 4), (8, 2)]
+    assert chunks[0].outputs == [lc.output_label("b"), lc.output_label(("b", "c"))]
+    np.testing.assert_array_equal(np.concatenate([chunk.parameters["frequency"] for chunk in chunks]),
+                                  frequencies)
+    expected = system.solve(2 * np.pi * frequencies) @ system.output_selectors(["b", ("b", "c")])
+    np.testing.assert_allclose(np.concatenate([chunk.values for chunk in chunks]), expected, rtol=1e-12)
+
+
+def test_stream_grid_chunks_follow_row_major_order():
+    system = series_rlc()
+    axes = [lc.SweepAxis("f", "frequency", [100.0, 1e3, 5e3]),
+            lc.SweepAxis("R", ("component", 0), [1.0, 10.0, 100.0, 1e3]),
+            lc.SweepAxis("V", ("voltage_source", 0), [1.0, 2.0])]
+    chunks = list(lc.stream_grid(system, axes, ["c"], chunk_size=5))
+    assert [(chunk.start, len(chunk)) for chunk in chunks] == [(0, 5), (5, 5), (10, 5), (15, 5), (20, 4)]
+    points = 0
+    for chunk in chunks:
+        for k in range(len(chunk)):
+            f, r, v = (chunk.parameters[name][k] for name in ("f", "R", "V"))
+            assert np.unravel_index(chunk.start + k, (3, 4, 2)) == (
+                axes[0].values.tolist().index(f), axes[1].values.tolist().index(r),
+                axes[2].values.tolist().index(v))
+            single = lc.MNASystem([("Resistor", r, "a", "b"), ("Inductor", L_SERIES, "b", "c"),
+                                   ("Capacitor", C_SERIES, "c", "GND")], [("Sine", v, 1000.0, 0.0, "a", "GND")])
+            x = single.solve(2 * np.pi * f)
+            assert chunk.values[k, 0] == pytest.approx(single.node_voltages(x)["c"], rel=1e-12)
+            points += 1
+    assert points == 24
+
+
+def test_csv_and_stats_stages(tmp_path):
+    system = series_rlc()
+    frequencies = np.logspace(1, 5, 301)
+    path = tmp_path / "response.csv"
+    stats = lc.MagnitudeStats()
+    chunks = list(stats(lc.write_csv(lc.stream_frequency_response(system, frequencies, ["b", "c"], chunk_size=64),
+                                     path)))
+    values = np.concatenate([chunk.values for chunk in chunks])
+    magnitude = np.abs(values)
+
+    with open(path, newline="", encoding="utf-8") as handle:
+        rows = list(csv.reader(handle))
+    assert rows[0] == ["index", "frequency", "|V(b)|", "∠V(b) (deg)", "|V(c)|", "∠V(c) (deg)"]
+    table = np.array(rows[1:], dtype=float)
+    assert table.shape == (301, 6)
+    np.testing.assert_array_equal(table[:, 0], np.arange(301))
+    np.testing.assert_allclose(table[:, 1], frequencies, rtol=1e-15)
+    np.testing.assert_allclose(table[:, 2::2], magnitude, rtol=1e-15)
+    np.testing.assert_allclose(table[:, 3::2], np.degrees(np.angle(values)), rtol=1e-15, atol=1e-12)
+
+    assert stats.outputs == ["V(b)", "V(c)"]
+    np.testing.assert_array_equal(stats.minimum, magnitude.min(axis=0))
+    np.testing.assert_array_equal(stats.maximum, magnitude.max(axis=0))
+    np.testing.assert_array_equal(stats.percentile(0), magnitude.min(axis=0))
+    np.testing.assert_array_equal(stats.percentile(100), magnitude.max(axis=0))
+    bin_width = 10 ** (1 / 100)  # bins_per_decade=100
+    for q in (1, 10, 25, 50, 75, 90, 99):
+        approx, exact = stats.percentile(q), np.percentile(magnitude, q, axis=0)
+        assert np.all(approx / exact <= bin_width) and np.all(exact / approx <= bin_width)